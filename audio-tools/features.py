@@ -0,0 +1,294 @@
+'''
+USAGE:$ python3 features.py INPUT [INPUT ...] -o PREFIX [-t mfcc|fbank]
+                            [--num-mel-bins B] [--num-ceps C] [--dither D]
+                            [-j JOBS]
+
+DESCRIPTION: Compute log-mel filterbank or MFCC features for the utterances
+of a Kaldi data dir (its wav.scp, see make_data_dir.py) or for WAV files
+(or the *.wav files of directories, named after their file names).
+
+The defaults follow Kaldi's: 25ms frames every 10ms (only whole frames),
+DC offset removed, 0.97 pre-emphasis, the povey window, a 20Hz to Nyquist
+mel scale with 23 bins, and 13 cepstra liftered by 22 with c0 replaced by
+the log energy of the frame. One difference: there is no dither unless
+--dither is given (Kaldi dithers by 1.0), so that the features of a file
+are always the same. Every utterance is
+framed in one go with a strided view of its samples, and the FFT, mel
+filterbank and DCT run over blocks of frames at once, so there is no loop
+over frames. Utterances are spread over JOBS processes.
+
+OUTPUT: PREFIX.f32, all the feature rows one after another as raw float32,
+        and PREFIX.idx, with the feature dimension on its first line and then
+        <uttId> <first row> <number of rows> for every utterance. Use
+        load_feature_archive() to memory-map the archive and look
+        utterances up by ID.
+'''
+
+from multiprocessing import Pool
+from functools import partial
+from contextlib import nullcontext
+from wav_io import map_wav_samples, to_float
+from numpy.lib.stride_tricks import as_strided
+import numpy as np
+import argparse
+import os
+
+EXT = '.wav'
+# frames transformed at a time, to bound the memory used on long recordings
+BLOCK_FRAMES = 4096
+
+defaults = {'frame_length_ms': 25.0,
+            'frame_shift_ms': 10.0,
+            'dither': 0.0,
+            'preemphasis': 0.97,
+            'num_mel_bins': 23,
+            'low_freq': 20.0,
+            'high_freq': 0.0,
+            'num_ceps': 13,
+            'cepstral_lifter': 22.0}
+
+
+def mel_scale(freq):
+    return 1127.0 * np.log(1.0 + freq / 700.0)
+
+
+def get_mel_filterbank(numBins,fftSize,sampleRate,lowFreq,highFreq):
+    '''
+    Return the (fftSize//2+1, numBins) matrix of triangular mel filters.
+    A highFreq of 0 or less is taken relative to the Nyquist frequency.
+    '''
+    nyquist = sampleRate / 2.0
+    if highFreq <= 0:
+        highFreq += nyquist
+    edges = np.linspace(mel_scale(lowFreq), mel_scale(highFreq), numBins+2)
+    fftMels = mel_scale(np.arange(fftSize//2+1) * sampleRate / fftSize)
+    left, center, right = edges[:-2], edges[1:-1], edges[2:]
+    rising = (fftMels[:,None] - left) / (center - left)
+    falling = (right - fftMels[:,None]) / (right - center)
+    return np.maximum(0, np.minimum(rising,falling)).astype(np.float32)
+
+
+def get_dct_matrix(numCeps,numBins):
+    '''
+    Return the (numBins, numCeps) orthonormal DCT-II matrix.
+    '''
+    n = np.arange(numBins)
+    dct = np.cos(np.pi / numBins * (n[:,None] + 0.5) * np.arange(numCeps))
+    dct *= np.sqrt(2.0 / numBins)
+    dct[:,0] /= np.sqrt(2.0)
+    return dct.astype(np.float32)
+
+
+def get_lifter(numCeps,lifter):
+    return (1.0 + 0.5 * lifter *
+            np.sin(np.pi * np.arange(numCeps) / lifter)).astype(np.float32)
+
+
+def get_povey_window(frameLength):
+    '''
+    Kaldi's default window: a Hann window raised to the power 0.85.
+    '''
+    n = np.arange(frameLength)
+    hann = 0.5 - 0.5*np.cos(2*np.pi*n/(frameLength-1))
+    return (hann**0.85).astype(np.float32)
+
+
+def frame_signal(signal,frameLength,frameShift):
+    '''
+    Return a (frames, frameLength) strided view of a 1-d signal with a frame
+    every frameShift samples, keeping only whole frames.
+    '''
+    numFrames = 1 + (len(signal) - frameLength) // frameShift
+    if numFrames <= 0:
+        return np.zeros((0,frameLength), dtype=signal.dtype)
+    stride = signal.strides[0]
+    return as_strided(signal, shape=(numFrames,frameLength),
+                      strides=(frameShift*stride,stride), writeable=False)
+
+
+def get_feature_setup(sampleRate,featureType,opts):
+    '''
+    Precompute everything which only depends on the sample rate and options.
+    '''
+    frameLength = int(sampleRate * opts['frame_length_ms'] / 1000)
+    frameShift = int(sampleRate * opts['frame_shift_ms'] / 1000)
+    fftSize = 1 << (frameLength-1).bit_length()
+    setup = {'frame_length': frameLength,
+             'frame_shift': frameShift,
+             'fft_size': fftSize,
+             'window': get_povey_window(frameLength),
+             'mel': get_mel_filterbank(opts['num_mel_bins'], fftSize,
+                                       sampleRate, opts['low_freq'],
+                                       opts['high_freq'])}
+    if featureType == 'mfcc':
+        setup['dct'] = get_dct_matrix(opts['num_ceps'],opts['num_mel_bins'])
+        setup['lifter'] = get_lifter(opts['num_ceps'],opts['cepstral_lifter'])
+    return setup
+
+
+def compute_features(signal,setup,featureType,opts):
+    '''
+    Return the (frames, dim) features of a 1-d float signal.
+    '''
+    frames = frame_signal(signal, setup['frame_length'], setup['frame_shift'])
+    dim = opts['num_ceps'] if featureType == 'mfcc' else opts['num_mel_bins']
+    features = np.empty((len(frames),dim), dtype=np.float32)
+    floor = np.finfo(np.float32).eps
+    # seeded, so that dithered features are the same from run to run
+    rng = np.random.default_rng(0)
+    for start in range(0, len(frames), BLOCK_FRAMES):
+        block = frames[start:start+BLOCK_FRAMES]
+        if opts['dither'] > 0:
+            block = block + opts['dither'] * \
+                rng.standard_normal(block.shape, dtype=np.float32)
+        block = block - block.mean(axis=1, keepdims=True)
+        # the energy of the frame before pre-emphasis and windowing
+        logEnergy = np.log(np.maximum(np.einsum('ij,ij->i',block,block),
+                                      floor))
+        # pre-emphasis, with the first sample of a frame as its own history
+        block[:,1:] -= opts['preemphasis'] * block[:,:-1].copy()
+        block[:,0] -= opts['preemphasis'] * block[:,0]
+        spectrum = np.fft.rfft(block * setup['window'], setup['fft_size'])
+        power = spectrum.real**2 + spectrum.imag**2
+        logMel = np.log(np.maximum(power.astype(np.float32) @ setup['mel'],
+                                   floor))
+        if featureType == 'mfcc':
+            features[start:start+len(block)] = \
+                (logMel @ setup['dct']) * setup['lifter']
+            features[start:start+len(block),0] = logEnergy
+        else:
+            features[start:start+len(block)] = logMel
+    return features
+
+
+def extract_utterance(utterance,featureType,opts):
+    '''
+    Return (uttId, features or None, error) for a (uttId, path) pair.
+    '''
+    uttId, path = utterance
+    try:
+        header, samples = map_wav_samples(path)
+        # the first channel, on the scale of 16-bit samples as in Kaldi
+        signal = to_float(samples[:,0],header) * 2**15
+    except (OSError, ValueError) as error:
+        return uttId, None, str(error)
+    setup = get_feature_setup(header['sample_rate'],featureType,opts)
+    return uttId, compute_features(signal,setup,featureType,opts), None
+
+
+def read_wav_scp(path):
+    utterances = []
+    with open(path, encoding='utf-8') as inFile:
+        for line in inFile:
+            fields = line.split(None,1)
+            if len(fields) == 2:
+                utterances.append((fields[0],fields[1].strip()))
+    return utterances
+
+
+def get_utterances(inputs):
+    '''
+    Return (uttId, path) pairs for data dirs, dirs of WAV files and WAV files.
+    '''
+    utterances = []
+    for path in inputs:
+        if os.path.isfile(os.path.join(path,'wav.scp')):
+            utterances += read_wav_scp(os.path.join(path,'wav.scp'))
+        elif os.path.isdir(path):
+            utterances += [(name[:-len(EXT)],os.path.join(path,name))
+                           for name in sorted(os.listdir(path))
+                           if name.endswith(EXT)]
+        else:
+            utterances.append((os.path.basename(path)[:-len(EXT)],path))
+    return utterances
+
+
+def write_feature_archive(prefix,utterances,featureType,opts,jobs=1):
+    '''
+    Extract the features of (uttId, path) pairs in jobs processes, appending
+    them to PREFIX.f32 in order as they come back. Returns the list of
+    (uttId, error) pairs for the utterances which failed.
+    '''
+    dim = opts['num_ceps'] if featureType == 'mfcc' else opts['num_mel_bins']
+    extract = partial(extract_utterance, featureType=featureType, opts=opts)
+    index = []
+    errors = []
+    numRows = 0
+    with open(prefix + '.f32', 'wb') as dataFile, \
+        (Pool(jobs) if jobs > 1 else nullcontext()) as pool:
+        if pool:
+            results = pool.imap(extract, utterances, chunksize=4)
+        else:
+            results = map(extract, utterances)
+        for uttId,features,error in results:
+            if error:
+                errors.append((uttId,error))
+                continue
+            dataFile.write(features.astype('<f4').tobytes())
+            index.append((uttId,numRows,len(features)))
+            numRows += len(features)
+    with open(prefix + '.idx', 'w', encoding='utf-8') as indexFile:
+        indexFile.write(str(dim) + '\n')
+        indexFile.writelines('%s %d %d\n' % entry for entry in index)
+    return errors
+
+
+def load_feature_archive(prefix):
+    '''
+    Memory-map an archive written by write_feature_archive(). Returns
+    (index, rows) where index maps an uttId to its (first row, number of
+    rows), so the features of an utterance are
+    rows[first:first+number].
+    '''
+    with open(prefix + '.idx', encoding='utf-8') as indexFile:
+        dim = int(indexFile.readline())
+        index = {}
+        for line in indexFile:
+            uttId, first, number = line.split()
+            index[uttId] = (int(first),int(number))
+    numRows = os.path.getsize(prefix + '.f32') // (4*dim)
+    if numRows == 0:
+        return index, np.zeros((0,dim), dtype='<f4')
+    return index, np.memmap(prefix + '.f32', dtype='<f4', mode='r',
+                            shape=(numRows,dim))
+
+
+def get_utterance_features(archive,uttId):
+    index, rows = archive
+    first, number = index[uttId]
+    return rows[first:first+number]
+
+
+def parse_user_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('inputs', type=str, nargs='+',
+                        help='Kaldi data dirs, WAV files or dirs of WAV files')
+    parser.add_argument('-o','--prefix', type=str, required=True,
+                        help='write PREFIX.f32 and PREFIX.idx')
+    parser.add_argument('-t','--type', type=str, default='mfcc',
+                        choices=['mfcc','fbank'], help='kind of features')
+    parser.add_argument('--num-mel-bins', type=int,
+                        default=defaults['num_mel_bins'])
+    parser.add_argument('--num-ceps', type=int, default=defaults['num_ceps'])
+    parser.add_argument('--dither', type=float, default=defaults['dither'],
+                        help='add Gaussian noise of this scale to the '
+                        'samples (Kaldi uses 1.0)')
+    parser.add_argument('-j','--jobs', type=int, default=os.cpu_count(),
+                        help='number of processes extracting features')
+    args = parser.parse_args()
+    return args
+
+if __name__ == '__main__':
+    args = parse_user_args()
+    opts = dict(defaults, num_mel_bins=args.num_mel_bins,
+                num_ceps=args.num_ceps, dither=args.dither)
+    utterances = get_utterances(args.inputs)
+    errors = write_feature_archive(args.prefix, utterances, args.type, opts,
+                                   args.jobs)
+    print('wrote ' +args.type+ ' features of ' +
+          str(len(utterances)-len(errors))+ ' utterances to ' +
+          args.prefix+ '.f32')
+    if errors:
+        print(str(len(errors)) + ' utterance(s) failed:')
+        for uttId,error in errors:
+            print('  ' +uttId+ ': ' +error)
@@ -0,0 +1,154 @@
+'''
+USAGE:$ python3 make_data_dir.py TRANSCRIPTS AUDIO_DIR DATA_DIR [-d DELIMITER]
+                                 [-r RATE] [-c CHANNELS] [-j JOBS]
+                                 [--cache FILE]
+
+DESCRIPTION: Make a Kaldi data directory from a transcript file (lines of
+<filename> <transcript>, as in stk-style/transcripts) and the WAV files of
+AUDIO_DIR named after its first column. Writes DATA_DIR/text, wav.scp,
+utt2spk, spk2utt and utt2dur, each sorted the way LC_ALL=C sort would.
+
+The audio is checked in one pass over the WAV headers, read in a pool of
+threads and cached as in wav_index.py. It must exist, be PCM, and have the
+given sample rate and number of channels. Utterances with a problem
+(missing or bad audio, empty or repeated transcripts) are left out, and all
+the problems are listed together at the end instead of stopping at the
+first one.
+
+The speaker of an utterance is its file name, or the part of it before
+DELIMITER with -d. Kaldi wants speaker IDs to be prefixes of utterance IDs,
+which both ways are.
+'''
+
+from wav_index import (index_files, load_cache, save_cache, read_transcripts,
+                       get_speaker, CACHE_NAME, EXT)
+from wav_io import WAVE_FORMAT_PCM
+from collections import defaultdict
+import argparse
+import os
+
+
+def c_sorted(lines):
+    '''
+    Sort lines the way LC_ALL=C sort does: by their bytes.
+    '''
+    return sorted(lines, key=lambda line: line.encode('utf-8'))
+
+
+def write_lines(path,lines):
+    with open(path, 'w', encoding='utf-8') as outFile:
+        outFile.writelines(line + '\n' for line in lines)
+
+
+def check_header(header,rate,channels):
+    '''
+    Return a list of the ways a WAV header doesn't fit the data directory.
+    '''
+    problems = []
+    if header['format'] != WAVE_FORMAT_PCM:
+        problems.append('not PCM (format %d)' % header['format'])
+    if rate and header['sample_rate'] != rate:
+        problems.append('sample rate %d' % header['sample_rate'])
+    if channels and header['channels'] != channels:
+        problems.append('%d channels' % header['channels'])
+    if header['frames'] == 0:
+        problems.append('no samples')
+    return problems
+
+
+def get_utterances(transcripts,audioDir,rate,channels,cache,jobs=16):
+    '''
+    Return the (uttId, transcript, path, header) of every usable utterance
+    in transcripts, and a list of (uttId, problem) for the others.
+    '''
+    problems = []
+    seen = set()
+    utterances = []
+    for uttId,transcript in transcripts:
+        if uttId in seen:
+            problems.append((uttId,'repeated utterance ID'))
+        elif not transcript:
+            problems.append((uttId,'empty transcript'))
+        else:
+            utterances.append((uttId,transcript))
+        seen.add(uttId)
+
+    paths = [os.path.abspath(os.path.join(audioDir,uttId+EXT))
+             for uttId,transcript in utterances]
+    usable = []
+    for (uttId,transcript),path,(header,error) in \
+        zip(utterances,paths,index_files(paths,cache,jobs)):
+        if error:
+            problems.append((uttId,error))
+            continue
+        headerProblems = check_header(header,rate,channels)
+        if headerProblems:
+            problems.append((uttId,path+ ': ' +', '.join(headerProblems)))
+            continue
+        usable.append((uttId,transcript,path,header))
+    return usable, problems
+
+
+def write_data_dir(dataDir,utterances,delimiter=None):
+    os.makedirs(dataDir, exist_ok=True)
+    utt2spk = {uttId: get_speaker(uttId,delimiter)
+               for uttId,transcript,path,header in utterances}
+    spk2utt = defaultdict(list)
+    for uttId in c_sorted(utt2spk):
+        spk2utt[utt2spk[uttId]].append(uttId)
+
+    write_lines(os.path.join(dataDir,'text'),
+                c_sorted(uttId+ ' ' +transcript
+                         for uttId,transcript,path,header in utterances))
+    write_lines(os.path.join(dataDir,'wav.scp'),
+                c_sorted(uttId+ ' ' +path
+                         for uttId,transcript,path,header in utterances))
+    write_lines(os.path.join(dataDir,'utt2dur'),
+                c_sorted(uttId+ ' ' +str(round(header['duration'],4))
+                         for uttId,transcript,path,header in utterances))
+    write_lines(os.path.join(dataDir,'utt2spk'),
+                c_sorted(uttId+ ' ' +speaker
+                         for uttId,speaker in utt2spk.items()))
+    write_lines(os.path.join(dataDir,'spk2utt'),
+                c_sorted(speaker+ ' ' +' '.join(uttIds)
+                         for speaker,uttIds in spk2utt.items()))
+
+
+def print_problems(problems):
+    print(str(len(problems)) + ' utterance(s) left out:')
+    for uttId,problem in problems:
+        print('  ' +uttId+ ': ' +problem)
+
+
+def parse_user_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('transcripts', type=str,
+                        help='2-column file such as <filename> <transcript>')
+    parser.add_argument('audio_dir', type=str, help='a dir of audio files')
+    parser.add_argument('data_dir', type=str,
+                        help='the Kaldi data directory to write')
+    parser.add_argument('-d','--delimiter', type=str, default=None,
+                        help='speaker ID is the file name up to this')
+    parser.add_argument('-r','--rate', type=int, default=16000,
+                        help='required sample rate (0 for any)')
+    parser.add_argument('-c','--channels', type=int, default=1,
+                        help='required number of channels (0 for any)')
+    parser.add_argument('-j','--jobs', type=int, default=16,
+                        help='number of threads reading headers')
+    parser.add_argument('--cache', type=str, default=None,
+                        help='header cache (default: AUDIO_DIR/'+CACHE_NAME+')')
+    args = parser.parse_args()
+    return args
+
+if __name__ == '__main__':
+    args = parse_user_args()
+    cachePath = args.cache or os.path.join(args.audio_dir,CACHE_NAME)
+    cache = load_cache(cachePath)
+    utterances, problems = get_utterances(read_transcripts(args.transcripts),
+                                          args.audio_dir, args.rate,
+                                          args.channels, cache, args.jobs)
+    save_cache(cachePath,cache)
+    write_data_dir(args.data_dir,utterances,args.delimiter)
+    print('wrote ' +str(len(utterances))+ ' utterances to ' +args.data_dir)
+    if problems:
+        print_problems(problems)
@@ -0,0 +1,190 @@
+'''
+USAGE:$ python3 resample.py INPUT [INPUT ...] -o OUT_DIR [-r RATE] [--mono]
+                            [-j JOBS] [--force]
+
+DESCRIPTION: Convert WAV files (or all the *.wav files of directories) to
+16-bit PCM at RATE (16000 by default), optionally downmixing them to mono,
+and write them to OUT_DIR under their own names. This replaces the
+per-file `sox $i -r 16k` and `sox $i ... remix 1,2` loops of
+sox_soxi_commands.txt.
+
+The samples are read through a memory map (see wav_io.py) and resampled
+with a polyphase windowed-sinc filter in NumPy: each phase of the filter
+runs over a strided view of the input, so only the input samples each
+output sample needs are touched. The mono downmix averages the
+channels, like remix 1,2 does. Files are spread over JOBS processes, and an
+output newer than its input, at the same rate and number of channels, is
+left alone unless --force is given.
+'''
+
+from multiprocessing import Pool
+from functools import partial
+from wav_io import map_wav_samples, read_wav_header, to_float, write_wav
+from numpy.lib.stride_tricks import as_strided
+import numpy as np
+import argparse
+import math
+import os
+
+EXT = '.wav'
+# zero crossings of the sinc on either side of its center, at the lower rate
+ZERO_CROSSINGS = 10
+KAISER_BETA = 5.0
+
+
+def get_polyphase_filter(up,down):
+    '''
+    Design the lowpass filter for resampling by up/down and split it into
+    up phases. Returns (phases, halfLen) where phases[p, j] is tap p + j*up
+    of the filter and halfLen is the index of its center.
+    '''
+    maxRate = max(up,down)
+    halfLen = ZERO_CROSSINGS * maxRate
+    n = np.arange(-halfLen, halfLen+1)
+    taps = np.sinc(n / maxRate) * np.kaiser(2*halfLen+1, KAISER_BETA)
+    # unity gain at DC once the input has been stretched by up
+    taps *= up / taps.sum()
+    numTaps = -(-len(taps) // up)
+    taps = np.concatenate([taps, np.zeros(numTaps*up - len(taps))])
+    return taps.reshape(numTaps,up).T.astype(np.float32), halfLen
+
+
+def resample(samples,inRate,outRate):
+    '''
+    Resample a float (frames, channels) array from inRate to outRate.
+
+    Output sample n is sum_j phases[p, j] * x[k - j], with
+    q = n*down + halfLen, k = q // up and p = q % up. Writing n = t*up + r
+    gives k = t*down + k0[r] and p = phase[r], so every column r of the
+    output, arranged as (t, r), is one phase filter run over a strided view
+    of the input which steps down samples per row.
+    '''
+    divisor = math.gcd(inRate,outRate)
+    up, down = outRate // divisor, inRate // divisor
+    if up == down:
+        return samples
+    phases, halfLen = get_polyphase_filter(up,down)
+    numTaps = phases.shape[1]
+    frames, channels = samples.shape
+    outFrames = -(-frames * up // down)
+    numRows = -(-outFrames // up)
+
+    r = np.arange(up)
+    k0 = (r*down + halfLen) // up
+    phase = (r*down + halfLen) % up
+    # pad so that every k - j is a valid index: x[i] is padded[i + numTaps]
+    padded = np.zeros((numRows*down + k0[-1] + numTaps + 1, channels),
+                      dtype=np.float32)
+    padded[numTaps:numTaps+frames] = samples
+    # with the taps reversed, x[k - j] for j = numTaps-1..0 is row t of a
+    # window starting at padded[k0 + 1 + t*down]
+    reversedPhases = phases[:,::-1]
+    rowStride, channelStride = padded.strides
+
+    out = np.empty((numRows,up,channels), dtype=np.float32)
+    for column in range(up):
+        windows = as_strided(padded[k0[column]+1:],
+                             shape=(numRows,numTaps,channels),
+                             strides=(down*rowStride,rowStride,channelStride))
+        out[:,column,:] = np.einsum('tjc,j->tc', windows,
+                                    reversedPhases[phase[column]])
+    return out.reshape(-1,channels)[:outFrames]
+
+
+def is_up_to_date(inPath,outPath,rate,mono):
+    '''
+    An output is up to date if it is newer than its input and has the sample
+    rate and number of channels asked for.
+    '''
+    try:
+        if os.path.getmtime(outPath) < os.path.getmtime(inPath):
+            return False
+        inHeader = read_wav_header(inPath)
+        outHeader = read_wav_header(outPath)
+    except (OSError, ValueError):
+        return False
+    channels = 1 if mono else inHeader['channels']
+    return outHeader['sample_rate'] == rate and \
+        outHeader['channels'] == channels
+
+
+def convert_file(inPath,outDir,rate,mono,force=False):
+    '''
+    Convert one file, returning (inPath, status) where status is 'converted',
+    'up to date' or an error message.
+    '''
+    outPath = os.path.join(outDir, os.path.basename(inPath))
+    if not force and is_up_to_date(inPath,outPath,rate,mono):
+        return inPath, 'up to date'
+    try:
+        header, samples = map_wav_samples(inPath)
+        samples = to_float(samples,header)
+    except (OSError, ValueError) as error:
+        return inPath, str(error)
+    if mono and samples.shape[1] > 1:
+        samples = samples.mean(axis=1, keepdims=True)
+    samples = resample(samples, header['sample_rate'], rate)
+    # write next to the output first, so it is never left half-written
+    write_wav(outPath + '.tmp', samples, rate)
+    os.replace(outPath + '.tmp', outPath)
+    return inPath, 'converted'
+
+
+def get_wav_paths(inputs):
+    paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            paths += [os.path.join(path,name)
+                      for name in sorted(os.listdir(path))
+                      if name.endswith(EXT)]
+        else:
+            paths.append(path)
+    return paths
+
+
+def convert_files(paths,outDir,rate,mono,jobs=1,force=False):
+    '''
+    Convert files in jobs processes, largest first so that no process is
+    left with a long file at the end. Returns the (path, status) pairs.
+    '''
+    os.makedirs(outDir, exist_ok=True)
+    paths = sorted(paths, key=lambda path: -os.path.getsize(path)
+                   if os.path.exists(path) else 0)
+    convert = partial(convert_file, outDir=outDir, rate=rate, mono=mono,
+                      force=force)
+    if jobs > 1:
+        with Pool(jobs) as pool:
+            return list(pool.imap_unordered(convert, paths))
+    return [convert(path) for path in paths]
+
+
+def parse_user_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('inputs', type=str, nargs='+',
+                        help='WAV files or dirs of WAV files')
+    parser.add_argument('-o','--outdir', type=str, required=True,
+                        help='where to write the converted files')
+    parser.add_argument('-r','--rate', type=int, default=16000,
+                        help='sample rate to convert to')
+    parser.add_argument('--mono', action='store_true',
+                        help='merge all channels into one')
+    parser.add_argument('-j','--jobs', type=int, default=os.cpu_count(),
+                        help='number of processes converting files')
+    parser.add_argument('--force', action='store_true',
+                        help='convert files even if their output is newer')
+    args = parser.parse_args()
+    return args
+
+if __name__ == '__main__':
+    args = parse_user_args()
+    results = convert_files(get_wav_paths(args.inputs), args.outdir,
+                            args.rate, args.mono, args.jobs, args.force)
+    statuses = [status for path,status in results]
+    print(str(statuses.count('converted')) + ' converted, ' +
+          str(statuses.count('up to date')) + ' up to date')
+    errors = [(path,status) for path,status in results
+              if status not in ('converted','up to date')]
+    if errors:
+        print(str(len(errors)) + ' file(s) could not be converted:')
+        for path,error in errors:
+            print('  ' +path+ ': ' +error)
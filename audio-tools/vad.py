@@ -0,0 +1,217 @@
+'''
+USAGE:$ python3 vad.py INPUT [INPUT ...] -o OUTFILE [-f segments|stm]
+                       [--on DB] [--off DB] [--min-speech S] [--min-silence S]
+                       [--padding S] [-j JOBS]
+
+DESCRIPTION: Find the stretches of speech in long recordings by their
+energy, so that silence can be cut before features and decoding. INPUT is
+a Kaldi data dir (its wav.scp), WAV files, or dirs of WAV files, named
+after their file names.
+
+Each recording is read in blocks of BLOCK_SECONDS through a memory map, so
+memory stays bounded however long it is. The energy (dBFS) of every 25ms
+frame, every 10ms, is computed for a whole block at once. Speech starts at a
+frame louder than --on and lasts until a frame quieter than --off
+(hysteresis), which is also resolved for a block at once. Gaps shorter than
+--min-silence are then closed, segments shorter than --min-speech dropped,
+and the rest padded by --padding on either side.
+
+OUTPUT: a Kaldi segments file, lines of
+            <recId>-<start cs>-<end cs> <recId> <start> <end>
+        or STM rows as stk-style/reformat_transcript_as_stm.sh writes them,
+            <recId> 1 <recId> <start> <end> <,>
+'''
+
+from multiprocessing import Pool
+from functools import partial
+from contextlib import nullcontext
+from wav_io import map_wav_samples, to_float
+from features import frame_signal, get_utterances
+import numpy as np
+import argparse
+import os
+
+BLOCK_SECONDS = 60
+FRAME_LENGTH_S = 0.025
+FRAME_SHIFT_S = 0.010
+
+defaults = {'on': -35.0,
+            'off': -45.0,
+            'min_speech': 0.25,
+            'min_silence': 0.3,
+            'padding': 0.1}
+
+
+def get_frame_energies(header,samples):
+    '''
+    Yield the energies (dBFS) of all frames of the first channel of mapped
+    samples, BLOCK_SECONDS of samples at a time.
+    '''
+    frameLength = int(header['sample_rate'] * FRAME_LENGTH_S)
+    frameShift = int(header['sample_rate'] * FRAME_SHIFT_S)
+    blockSamples = int(header['sample_rate'] * BLOCK_SECONDS)
+    carry = np.zeros(0, dtype=np.float32)
+    for start in range(0, header['frames'], blockSamples):
+        block = np.concatenate([carry,
+                                to_float(samples[start:start+blockSamples,0],
+                                         header)])
+        frames = frame_signal(block,frameLength,frameShift)
+        # the next block starts with the samples from the next frame on
+        carry = block[len(frames)*frameShift:]
+        if len(frames) == 0:
+            continue
+        yield 10*np.log10(np.einsum('ij,ij->i',frames,frames) / frameLength
+                          + 1e-10)
+
+
+def apply_hysteresis(energy,on,off,state):
+    '''
+    Return the speech/non-speech decision of every frame, given the decision
+    of the frame before: a frame over on starts speech, a frame under off
+    ends it, and anything in between keeps the decision of the frame before.
+    '''
+    label = np.zeros(len(energy), dtype=np.int8)
+    label[energy > on] = 1
+    label[energy < off] = -1
+    # carry the last decided label forward
+    lastDecided = np.where(label != 0, np.arange(len(label)), -1)
+    lastDecided = np.maximum.accumulate(lastDecided)
+    decisions = np.where(lastDecided >= 0, label[lastDecided] > 0, state)
+    return decisions
+
+
+def get_speech_segments(path,opts):
+    '''
+    Return the recording's duration and its (start, end) speech segments in
+    frames.
+    '''
+    header, samples = map_wav_samples(path)
+    segments = []
+    state = False
+    startFrame = 0
+    numFrames = 0
+    for energy in get_frame_energies(header,samples):
+        decisions = apply_hysteresis(energy,opts['on'],opts['off'],state)
+        # where speech starts and stops within the block
+        changes = np.flatnonzero(np.diff(np.concatenate([[state],decisions]))
+                                 .astype(bool))
+        for change in changes:
+            if decisions[change]:
+                startFrame = numFrames + change
+            else:
+                segments.append((startFrame, numFrames + change))
+        state = bool(decisions[-1])
+        numFrames += len(energy)
+    if state:
+        segments.append((startFrame,numFrames))
+    return header['duration'], numFrames, segments
+
+
+def clean_segments(segments,numFrames,opts):
+    '''
+    Close short gaps, drop short segments and pad the rest (all in frames).
+    '''
+    minSilence = int(round(opts['min_silence'] / FRAME_SHIFT_S))
+    minSpeech = int(round(opts['min_speech'] / FRAME_SHIFT_S))
+    padding = int(round(opts['padding'] / FRAME_SHIFT_S))
+    merged = []
+    for start,end in segments:
+        if merged and start - merged[-1][1] < minSilence:
+            merged[-1] = (merged[-1][0],end)
+        else:
+            merged.append((start,end))
+    padded = []
+    for start,end in merged:
+        if end - start < minSpeech:
+            continue
+        start, end = max(0,start-padding), min(numFrames,end+padding)
+        if padded and start <= padded[-1][1]:
+            padded[-1] = (padded[-1][0],end)
+        else:
+            padded.append((start,end))
+    return padded
+
+
+def segment_recording(recording,opts):
+    '''
+    Return (recId, duration, segments in seconds, error) for a (recId, path)
+    pair.
+    '''
+    recId, path = recording
+    try:
+        duration, numFrames, segments = get_speech_segments(path,opts)
+    except (OSError, ValueError) as error:
+        return recId, 0.0, [], str(error)
+    segments = clean_segments(segments,numFrames,opts)
+    # the last frame of a segment runs on past its shift
+    overhang = FRAME_LENGTH_S - FRAME_SHIFT_S
+    return recId, duration, [(start*FRAME_SHIFT_S,
+                              min(duration,end*FRAME_SHIFT_S + overhang))
+                             for start,end in segments], None
+
+
+def format_segment(recId,start,end,outFormat):
+    # times in centiseconds, so that segment IDs and times agree
+    start, end = int(round(start*100)), int(round(end*100))
+    if outFormat == 'stm':
+        return '%s 1 %s %.2f %.2f <,>\n' % (recId, recId, start/100, end/100)
+    return '%s-%07d-%07d %s %.2f %.2f\n' % (recId, start, end, recId,
+                                            start/100, end/100)
+
+
+def parse_user_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('inputs', type=str, nargs='+',
+                        help='Kaldi data dirs, WAV files or dirs of WAV files')
+    parser.add_argument('-o','--outfile', type=str, required=True,
+                        help='where to write the segments')
+    parser.add_argument('-f','--format', type=str, default='segments',
+                        choices=['segments','stm'], help='output format')
+    parser.add_argument('--on', type=float, default=defaults['on'],
+                        help='frame energy (dBFS) which starts speech')
+    parser.add_argument('--off', type=float, default=defaults['off'],
+                        help='frame energy (dBFS) which ends speech')
+    parser.add_argument('--min-speech', type=float,
+                        default=defaults['min_speech'],
+                        help='drop segments shorter than this (seconds)')
+    parser.add_argument('--min-silence', type=float,
+                        default=defaults['min_silence'],
+                        help='close gaps shorter than this (seconds)')
+    parser.add_argument('--padding', type=float, default=defaults['padding'],
+                        help='seconds of context kept around segments')
+    parser.add_argument('-j','--jobs', type=int, default=os.cpu_count(),
+                        help='number of processes segmenting recordings')
+    args = parser.parse_args()
+    if args.off > args.on:
+        parser.error('--off must not be over --on')
+    return args
+
+if __name__ == '__main__':
+    args = parse_user_args()
+    opts = {'on': args.on, 'off': args.off, 'min_speech': args.min_speech,
+            'min_silence': args.min_silence, 'padding': args.padding}
+    recordings = get_utterances(args.inputs)
+    segment = partial(segment_recording, opts=opts)
+    totalDuration = speechDuration = 0.0
+    errors = []
+    with open(args.outfile, 'w', encoding='utf-8') as outFile, \
+        (Pool(args.jobs) if args.jobs > 1 else nullcontext()) as pool:
+        if pool:
+            results = pool.imap(segment, recordings)
+        else:
+            results = map(segment, recordings)
+        for recId,duration,segments,error in results:
+            if error:
+                errors.append((recId,error))
+                continue
+            totalDuration += duration
+            for start,end in segments:
+                speechDuration += end - start
+                outFile.write(format_segment(recId,start,end,args.format))
+    print('kept %.2f of %.2f seconds (%.1f%%) as speech' %
+          (speechDuration, totalDuration,
+           100*speechDuration/totalDuration if totalDuration else 0))
+    if errors:
+        print(str(len(errors)) + ' recording(s) failed:')
+        for recId,error in errors:
+            print('  ' +recId+ ': ' +error)
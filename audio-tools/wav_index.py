@@ -0,0 +1,207 @@
+'''
+USAGE:$ python3 wav_index.py AUDIO_DIR [-t TRANSCRIPTS] [-o OUTFILE.stm]
+                             [-d DELIMITER] [-j JOBS] [--stats FILE]
+                             [--cache FILE]
+
+DESCRIPTION: Index the WAV files of AUDIO_DIR by reading their headers (see
+wav_io.py) in a pool of threads, instead of forking soxi once per file.
+Durations are cached by path, size and modification time, so a rerun only
+reads the headers of new or changed files.
+
+Given TRANSCRIPTS (lines of <filename> <transcript>, as for
+stk-style/reformat_transcript_as_stm.sh), writes the STM file that script
+makes:
+
+    <filename> 1 <speakerid> 0 <duration> <,> <transcript>
+
+where the speaker is the file name, or the part of it before DELIMITER with
+-d. Without TRANSCRIPTS every *.wav file of AUDIO_DIR is indexed. Either way
+the total duration and the duration per speaker are printed, and written
+as JSON with --stats.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+from wav_io import read_wav_header
+import argparse
+import json
+import os
+
+EXT = '.wav'
+CACHE_NAME = '.wav_index.json'
+
+
+def load_cache(cachePath):
+    if cachePath is None or not os.path.exists(cachePath):
+        return {}
+    with open(cachePath, encoding='utf-8') as inFile:
+        return json.load(inFile)
+
+
+def save_cache(cachePath,cache):
+    tmpPath = cachePath + '.tmp'
+    with open(tmpPath, 'w', encoding='utf-8') as outFile:
+        json.dump(cache, outFile)
+    os.replace(tmpPath,cachePath)
+
+
+def get_cached_header(path,cache):
+    '''
+    Return the cached header of a WAV file if its size and modification time
+    haven't changed, otherwise None.
+    '''
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    entry = cache.get(path)
+    if entry and entry['size'] == stat.st_size and \
+       entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['header']
+    return None
+
+
+def index_file(path):
+    '''
+    Return (path, header, cache entry, error) for a WAV file.
+    '''
+    try:
+        stat = os.stat(path)
+        header = read_wav_header(path)
+    except (OSError, ValueError) as error:
+        return path, None, None, str(error)
+    return path, header, {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                          'header': header}, None
+
+
+def index_files(paths,cache,jobs=16):
+    '''
+    Return a (header, error) pair for every WAV file in paths, in order.
+    Headers of files which aren't in cache are read in jobs threads and
+    added to it.
+    '''
+    paths = [os.path.abspath(path) for path in paths]
+    results = {}
+    misses = []
+    for path in paths:
+        header = get_cached_header(path,cache)
+        if header is None:
+            misses.append(path)
+        else:
+            results[path] = (header,None)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for path,header,entry,error in executor.map(index_file,misses):
+            if entry is not None:
+                cache[path] = entry
+            results[path] = (header,error)
+    return [results[path] for path in paths]
+
+
+def read_transcripts(fileName):
+    '''
+    Yield (filename, transcript) for the non-empty lines of a transcript file.
+    '''
+    with open(fileName, encoding='utf-8') as inFile:
+        for line in inFile:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            fields = line.lstrip(' ').split(' ',1)
+            # runs of spaces collapse, as echo does with the unquoted
+            # $transcription of reformat_transcript_as_stm.sh
+            yield fields[0], ' '.join(fields[1].split()) if len(fields) > 1 \
+                else ''
+
+
+def get_speaker(uttId,delimiter=None):
+    if delimiter is None:
+        return uttId
+    return uttId.split(delimiter,1)[0]
+
+
+def get_duration_stats(durations):
+    '''
+    Given (speaker, duration) pairs, return the number of files and the total
+    duration in seconds, overall and per speaker.
+    '''
+    perSpeaker = defaultdict(lambda: {'files': 0, 'seconds': 0.0})
+    for speaker,duration in durations:
+        perSpeaker[speaker]['files'] += 1
+        perSpeaker[speaker]['seconds'] += duration
+    return {'files': sum(stats['files'] for stats in perSpeaker.values()),
+            'seconds': sum(stats['seconds'] for stats in perSpeaker.values()),
+            'speakers': dict(sorted(perSpeaker.items()))}
+
+
+def write_stm(outPath,rows):
+    '''
+    Write (filename, speaker, duration, transcript) rows as STM lines.
+    '''
+    with open(outPath, 'w', encoding='utf-8') as outFile:
+        outFile.writelines('%s 1 %s 0 %f <,> %s\n' % row for row in rows)
+
+
+def print_stats(stats):
+    print('%d files, %.2f seconds (%.2f hours)' %
+          (stats['files'], stats['seconds'], stats['seconds']/3600))
+    for speaker,speakerStats in stats['speakers'].items():
+        print('  %-20s %6d files %12.2f seconds' %
+              (speaker, speakerStats['files'], speakerStats['seconds']))
+
+
+def parse_user_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('audio_dir', type=str, help='a dir of audio files')
+    parser.add_argument('-t','--transcripts', type=str, default=None,
+                        help='2-column file such as <filename> <transcript>')
+    parser.add_argument('-o','--outfile', type=str,
+                        default='new-transcripts.stm',
+                        help='where to write the STM file (with -t)')
+    parser.add_argument('-d','--delimiter', type=str, default=None,
+                        help='speaker ID is the file name up to this')
+    parser.add_argument('-j','--jobs', type=int, default=16,
+                        help='number of threads reading headers')
+    parser.add_argument('--stats', type=str, default=None,
+                        help='write the duration stats to this JSON file')
+    parser.add_argument('--cache', type=str, default=None,
+                        help='header cache (default: AUDIO_DIR/'+CACHE_NAME+')')
+    args = parser.parse_args()
+    return args
+
+if __name__ == '__main__':
+    args = parse_user_args()
+    cachePath = args.cache or os.path.join(args.audio_dir,CACHE_NAME)
+    cache = load_cache(cachePath)
+
+    if args.transcripts:
+        utterances = list(read_transcripts(args.transcripts))
+    else:
+        utterances = [(name[:-len(EXT)],None)
+                      for name in sorted(os.listdir(args.audio_dir))
+                      if name.endswith(EXT)]
+    paths = [os.path.join(args.audio_dir,uttId+EXT)
+             for uttId,transcript in utterances]
+    headers = index_files(paths,cache,args.jobs)
+    save_cache(cachePath,cache)
+
+    rows = []
+    errors = []
+    for (uttId,transcript),path,(header,error) in zip(utterances,paths,headers):
+        if error:
+            errors.append(error)
+            continue
+        rows.append((uttId, get_speaker(uttId,args.delimiter),
+                     header['duration'], transcript))
+    if args.transcripts:
+        write_stm(args.outfile,rows)
+
+    stats = get_duration_stats((speaker,duration)
+                               for uttId,speaker,duration,transcript in rows)
+    print_stats(stats)
+    if args.stats:
+        with open(args.stats, 'w', encoding='utf-8') as outFile:
+            json.dump(stats, outFile, indent=2, ensure_ascii=False)
+    if errors:
+        print(str(len(errors)) + ' file(s) could not be indexed:')
+        for error in errors:
+            print('  ' + error)
@@ -0,0 +1,154 @@
+'''
+Reading RIFF/WAVE files without decoding them.
+
+read_wav_header() walks the chunks of a WAV file, seeking over everything
+that isn't "fmt " or "data", so it only ever reads a few dozen bytes however
+long the recording is. The header tells where the samples start and how
+many there are, which is all that durations, indexes and validation need.
+
+map_wav_samples() memory-maps the samples in place (frames x channels), so
+a block of a long recording can be converted with to_float() without
+reading the rest, and write_wav() writes 16-bit PCM.
+'''
+
+import numpy as np
+import struct
+import os
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def read_wav_header(path):
+    '''
+    Return a dict with the format, channels, sample_rate, bits_per_sample,
+    block_align, data_offset, frames and duration (in seconds) of a WAV file.
+    Raises ValueError if it isn't one.
+    '''
+    fileSize = os.path.getsize(path)
+    with open(path,'rb') as inFile:
+        riff = inFile.read(12)
+        if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+            raise ValueError(path + ' is not a RIFF/WAVE file')
+        header = None
+        while True:
+            chunkHeader = inFile.read(8)
+            if len(chunkHeader) < 8:
+                raise ValueError(path + ' has no data chunk')
+            chunkId, chunkSize = struct.unpack('<4sI', chunkHeader)
+            if chunkId == b'fmt ':
+                fmt = inFile.read(chunkSize)
+                if len(fmt) < 16:
+                    raise ValueError(path + ' has a truncated fmt chunk')
+                (formatTag, channels, sampleRate, byteRate, blockAlign,
+                 bitsPerSample) = struct.unpack('<HHIIHH', fmt[:16])
+                if formatTag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                    # the real format is the start of the SubFormat GUID
+                    formatTag = struct.unpack('<H', fmt[24:26])[0]
+                header = {'format': formatTag,
+                          'channels': channels,
+                          'sample_rate': sampleRate,
+                          'bits_per_sample': bitsPerSample,
+                          'block_align': blockAlign}
+                # chunks are padded to an even number of bytes
+                inFile.seek(chunkSize % 2, 1)
+            elif chunkId == b'data':
+                if header is None:
+                    raise ValueError(path + ' has data before its fmt chunk')
+                dataOffset = inFile.tell()
+                # streamed files may leave the size unset (0 or 0xFFFFFFFF)
+                if chunkSize == 0 or dataOffset + chunkSize > fileSize:
+                    chunkSize = fileSize - dataOffset
+                if header['block_align'] == 0 or header['sample_rate'] == 0:
+                    raise ValueError(path + ' has an invalid fmt chunk')
+                header['data_offset'] = dataOffset
+                header['frames'] = chunkSize // header['block_align']
+                header['duration'] = header['frames'] / header['sample_rate']
+                return header
+            else:
+                inFile.seek(chunkSize + chunkSize % 2, 1)
+
+
+def get_sample_dtype(header):
+    '''
+    Return the NumPy dtype of one sample of a PCM or float WAV file, with
+    24-bit samples read as 3 bytes.
+    '''
+    bits = header['bits_per_sample']
+    if header['format'] == WAVE_FORMAT_PCM:
+        dtypes = {8: np.uint8, 16: np.dtype('<i2'), 24: np.uint8,
+                  32: np.dtype('<i4')}
+    elif header['format'] == WAVE_FORMAT_IEEE_FLOAT:
+        dtypes = {32: np.dtype('<f4'), 64: np.dtype('<f8')}
+    else:
+        dtypes = {}
+    if bits not in dtypes or \
+       header['block_align'] != header['channels'] * bits // 8:
+        raise ValueError('unsupported WAV format %d with %d bits per sample'
+                         % (header['format'], bits))
+    return dtypes[bits]
+
+
+def map_wav_samples(path,header=None):
+    '''
+    Memory-map the samples of a WAV file as a (frames, channels) array of
+    its own sample type, (frames, channels, 3) bytes for 24-bit files.
+    Returns (header, samples).
+    '''
+    if header is None:
+        header = read_wav_header(path)
+    dtype = get_sample_dtype(header)
+    shape = (header['frames'], header['channels'])
+    if header['bits_per_sample'] == 24:
+        shape += (3,)
+    if header['frames'] == 0:
+        return header, np.zeros(shape, dtype=dtype)
+    return header, np.memmap(path, dtype=dtype, mode='r',
+                             offset=header['data_offset'], shape=shape)
+
+
+def to_float(samples,header):
+    '''
+    Convert (a block of) mapped samples to float32 in [-1, 1).
+    '''
+    bits = header['bits_per_sample']
+    if header['format'] == WAVE_FORMAT_IEEE_FLOAT:
+        return np.asarray(samples, dtype=np.float32)
+    if bits == 8:
+        return (samples.astype(np.float32) - 128) / 128
+    if bits == 24:
+        # little-endian 3 byte ints, shifted into the top of an int32
+        samples = samples.astype(np.int32)
+        samples = (samples[...,0] << 8 | samples[...,1] << 16 |
+                   samples[...,2] << 24)
+        bits = 32
+    return samples.astype(np.float32) / 2**(bits-1)
+
+
+def read_wav(path):
+    '''
+    Return (header, samples) with all the samples of a WAV file as a float32
+    (frames, channels) array.
+    '''
+    header, samples = map_wav_samples(path)
+    return header, to_float(samples,header)
+
+
+def write_wav(path,samples,sampleRate):
+    '''
+    Write float samples, (frames, channels) or just (frames,), as 16-bit PCM.
+    '''
+    if samples.ndim == 1:
+        samples = samples[:,None]
+    frames, channels = samples.shape
+    pcm = np.clip(np.round(samples * 2**15), -2**15, 2**15-1).astype('<i2')
+    dataSize = frames * channels * 2
+    with open(path,'wb') as outFile:
+        outFile.write(b'RIFF' + struct.pack('<I', 36 + dataSize) + b'WAVE')
+        outFile.write(b'fmt ' + struct.pack('<IHHIIHH', 16, WAVE_FORMAT_PCM,
+                                            channels, sampleRate,
+                                            sampleRate * channels * 2,
+                                            channels * 2, 16))
+        outFile.write(b'data' + struct.pack('<I', dataSize))
+        outFile.write(pcm.tobytes())
@@ -0,0 +1,41 @@
+'''
+USAGE:$ python3 compare.py OLD.json NEW.json
+
+DESCRIPTION: Compare two results files of run_benchmarks.py, printing the
+wall time and peak memory of every stage, language and corpus size run in
+both, and how many times faster NEW is than OLD.
+'''
+
+import argparse
+import json
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as inFile:
+        results = json.load(inFile)['results']
+    return {(result['stage'],result['language'],result['tokens']): result
+            for result in results}
+
+
+def parse_user_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('old', type=str, help='results of the baseline run')
+    parser.add_argument('new', type=str, help='results of the run to compare')
+    args = parser.parse_args()
+    return args
+
+if __name__ == '__main__':
+    args = parse_user_args()
+    old = load_results(args.old)
+    new = load_results(args.new)
+    print('%-14s %-4s %10s %10s %10s %8s %10s %10s' %
+          ('stage','lang','tokens','old s','new s','speedup','old MB','new MB'))
+    for key in sorted(set(old) & set(new)):
+        stage,lang,numTokens = key
+        print('%-14s %-4s %10d %10.2f %10.2f %7.2fx %10.1f %10.1f' %
+              (stage, lang, numTokens, old[key]['wall_s'], new[key]['wall_s'],
+               old[key]['wall_s']/new[key]['wall_s'],
+               old[key]['peak_rss_mb'], new[key]['peak_rss_mb']))
+    for key in sorted(set(old) ^ set(new)):
+        print('only in ' + (args.old if key in old else args.new) + ': ' +
+              ' '.join(map(str,key)))
@@ -0,0 +1,134 @@
+'''
+USAGE:$ python3 make_corpus.py -o OUTFILE [-l ky|tr] [-t TOKENS] [-v VOCAB]
+                               [-z EXPONENT] [--messy] [--seed SEED]
+
+DESCRIPTION: Write a reproducible synthetic corpus for benchmarking. Words
+are strings of (C)V(C) syllables over the Kyrgyz or Turkish alphabet, and
+the tokens are drawn from a Zipfian distribution over VOCAB such words (the
+word of rank r has probability proportional to 1/r**EXPONENT).
+
+By default the corpus looks like the output of clean_text.py, one sentence
+per line between <s> and </s>. With --messy it looks like raw text instead:
+capitalized sentences with punctuation and numbers, several to a line.
+'''
+
+import numpy as np
+import argparse
+
+# (consonants, vowels) of each language
+alphabets = {'ky': ('пбдткгхшщжзсцчйлмнңфвр', 'аоуыиеэөүюяё'),
+             'tr': ('bcçdfgğhjklmnprsştvyz', 'aâeıiîoöuûü')}
+
+MIN_SENTENCE_LENGTH = 3
+MAX_SENTENCE_LENGTH = 20
+
+
+def make_vocab(lang,vocabSize,rng):
+    '''
+    Return vocabSize distinct words of 1-4 (C)V(C) syllables, in the order
+    of their rank.
+    '''
+    consonants,vowels = alphabets[lang]
+    words = []
+    seen = set()
+    while len(words) < vocabSize:
+        syllables = []
+        for _ in range(rng.randint(1,5)):
+            onset = consonants[rng.randint(len(consonants))] \
+                    if rng.rand() < 0.8 else ''
+            coda = consonants[rng.randint(len(consonants))] \
+                   if rng.rand() < 0.3 else ''
+            syllables.append(onset + vowels[rng.randint(len(vowels))] + coda)
+        word = ''.join(syllables)
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def get_zipf_probs(vocabSize,exponent):
+    probs = 1.0 / np.arange(1,vocabSize+1)**exponent
+    return probs / probs.sum()
+
+
+def generate_sentences(lang,numTokens,vocabSize,exponent,seed):
+    '''
+    Yield lists of words until numTokens words have been drawn.
+    '''
+    rng = np.random.RandomState(seed)
+    vocab = make_vocab(lang,vocabSize,rng)
+    probs = get_zipf_probs(vocabSize,exponent)
+    numDrawn = 0
+    while numDrawn < numTokens:
+        # draw many sentences' worth of ranks at a time
+        lengths = rng.randint(MIN_SENTENCE_LENGTH,MAX_SENTENCE_LENGTH+1,
+                              size=1000)
+        ranks = rng.choice(vocabSize, size=int(lengths.sum()), p=probs)
+        start = 0
+        for length in lengths:
+            length = min(length,numTokens-numDrawn)
+            if length <= 0:
+                return
+            yield [vocab[rank] for rank in ranks[start:start+length]]
+            start += length
+            numDrawn += length
+
+
+def make_messy_line(sentences,rng):
+    '''
+    Join sentences into a raw line: capitalized, with punctuation, and the
+    odd number for clean_text.py to throw away.
+    '''
+    line = []
+    for words in sentences:
+        words = list(words)
+        words[0] = words[0].capitalize()
+        if rng.rand() < 0.2:
+            words.insert(rng.randint(len(words)), str(rng.randint(1,2017)))
+        if len(words) > 4 and rng.rand() < 0.5:
+            words[len(words)//2] += ','
+        line.append(' '.join(words) + '.!?'[rng.randint(3)])
+    return ' '.join(line) + '\n'
+
+
+def write_corpus(outPath,lang,numTokens,vocabSize,exponent=1.0,seed=0,
+                 messy=False):
+    rng = np.random.RandomState(seed+1)
+    sentences = generate_sentences(lang,numTokens,vocabSize,exponent,seed)
+    with open(outPath, 'w', encoding='utf-8') as outFile:
+        if not messy:
+            for words in sentences:
+                outFile.write('<s> ' + ' '.join(words) + ' </s>\n')
+            return
+        line = []
+        for words in sentences:
+            line.append(words)
+            if rng.rand() < 0.4:
+                outFile.write(make_messy_line(line,rng))
+                line = []
+        if line:
+            outFile.write(make_messy_line(line,rng))
+
+
+def parse_user_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o','--outfile', type=str, required=True,
+                        help='where to write the corpus')
+    parser.add_argument('-l','--language', type=str, default='ky',
+                        choices=sorted(alphabets), help='alphabet of the words')
+    parser.add_argument('-t','--tokens', type=int, default=1000000,
+                        help='number of words in the corpus')
+    parser.add_argument('-v','--vocab', type=int, default=50000,
+                        help='number of distinct words to draw from')
+    parser.add_argument('-z','--zipf', type=float, default=1.0,
+                        help='exponent of the Zipfian distribution')
+    parser.add_argument('--messy', action='store_true',
+                        help='write raw text instead of cleaned sentences')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+    return args
+
+if __name__ == '__main__':
+    args = parse_user_args()
+    write_corpus(args.outfile, args.language, args.tokens, args.vocab,
+                 args.zipf, args.seed, args.messy)
@@ -0,0 +1,200 @@
+'''
+USAGE:$ python3 run_benchmarks.py [-o RESULTS.json] [-t TOKENS [TOKENS ...]]
+                                  [-l ky tr] [-s STAGE [STAGE ...]]
+                                  [-v VOCAB] [-r REPEAT] [-w WORKDIR]
+
+DESCRIPTION: Run every stage of the text pipeline (clean_text.py,
+cutoff_words.py, ngrams.py, create_phonetic_dict.py, syllables.py) on
+synthetic corpora of the given sizes (see make_corpus.py), each run in a
+fresh process, and write the wall time, peak memory and throughput of every
+run to a JSON results file. Compare two results files with compare.py.
+
+Wall times include starting the interpreter and importing the script's
+modules, as they do for anyone running the scripts. Stages which only
+support Kyrgyz are skipped for Turkish.
+
+The corpora are written by make_corpus.py in a process of its own: on Linux
+a child process starts out with the peak memory of the process it was forked
+from, so this one has to stay small for the peak memory of the stages to
+mean anything.
+'''
+
+import subprocess
+import tempfile
+import platform
+import argparse
+import datetime
+import json
+import time
+import sys
+import os
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# script, languages, input corpus ('clean' or 'messy') and arguments of each
+# stage; {input}, {output} and {lang} are filled in for each run
+stages = {
+    'clean_text': ('language-model/clean_text.py', ['ky'], 'messy',
+                   ['{input}','-o','{output}','-l','kyrgyz']),
+    'cutoff_words': ('language-model/cutoff_words.py', ['ky','tr'], 'clean',
+                     ['-i','{input}','-k','1','-a','replace']),
+    'ngrams_mle': ('language-model/ngrams.py', ['ky','tr'], 'clean',
+                   ['-i','{input}','-o','{output}','-n','3']),
+    'ngrams_kn': ('language-model/ngrams.py', ['ky','tr'], 'clean',
+                  ['-i','{input}','-o','{output}','-n','3',
+                   '-s','kneser-ney']),
+    'phonetic_dict': ('phonetic-dict/create_phonetic_dict.py', ['ky'], 'clean',
+                      ['-i','{input}','-l','kyrgyz']),
+    'syllables': ('kaldi-style/syllables.py', ['ky','tr'], 'clean',
+                  ['-l','{lang}','{input}','-o','{output}']),
+}
+
+
+def run_command(command,cwd):
+    '''
+    Run command and return its wall time in seconds and its peak resident
+    memory in MB.
+    '''
+    with tempfile.TemporaryFile() as errFile:
+        startTime = time.perf_counter()
+        process = subprocess.Popen(command, cwd=cwd, stdout=subprocess.DEVNULL,
+                                   stderr=errFile)
+        _,status,usage = os.wait4(process.pid,0)
+        wallTime = time.perf_counter() - startTime
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if process.returncode != 0:
+            errFile.seek(0)
+            raise RuntimeError(' '.join(command) + ' failed:\n' +
+                               errFile.read().decode('utf-8','replace'))
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peakRss = usage.ru_maxrss / (2**20 if sys.platform == 'darwin' else 2**10)
+    return wallTime, peakRss
+
+
+def count_arpa_ngrams(path):
+    '''
+    Sum the "ngram N=COUNT" lines of an ARPA header.
+    '''
+    total = 0
+    with open(path, encoding='utf-8') as inFile:
+        for line in inFile:
+            if line.startswith('ngram '):
+                total += int(line.split('=')[1])
+            elif line.startswith('\\1-grams:'):
+                break
+    return total
+
+
+def write_corpus(outPath,lang,numTokens,args,messy):
+    command = [sys.executable, os.path.join(REPO,'benchmarks','make_corpus.py'),
+               '-o', outPath, '-l', lang, '-t', str(numTokens),
+               '-v', str(args.vocab), '-z', str(args.zipf),
+               '--seed', str(args.seed)]
+    if messy:
+        command.append('--messy')
+    subprocess.run(command, check=True)
+
+
+def run_stage(stage,lang,inPath,numTokens,workDir,repeat):
+    '''
+    Run a stage repeat times on inPath and return a result with its fastest
+    wall time and largest peak memory.
+    '''
+    script,_,_,stageArgs = stages[stage]
+    outPath = os.path.join(workDir, stage+'.out')
+    command = [sys.executable, os.path.join(REPO,script)] + \
+              [arg.format(input=inPath,output=outPath,lang=lang)
+               for arg in stageArgs]
+    runs = [run_command(command,workDir) for _ in range(repeat)]
+    wallTime = min(wallTime for wallTime,_ in runs)
+    result = {'stage': stage,
+              'language': lang,
+              'tokens': numTokens,
+              'input_bytes': os.path.getsize(inPath),
+              'wall_s': round(wallTime,4),
+              'all_wall_s': [round(wallTime,4) for wallTime,_ in runs],
+              'peak_rss_mb': round(max(peakRss for _,peakRss in runs),1),
+              'tokens_per_s': round(numTokens/wallTime,1)}
+    if stage.startswith('ngrams'):
+        numNgrams = count_arpa_ngrams(outPath)
+        result['ngrams'] = numNgrams
+        result['ngrams_per_s'] = round(numNgrams/wallTime,1)
+    return result
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(['git','rev-parse','HEAD'], cwd=REPO,
+                                       stderr=subprocess.DEVNULL
+                                       ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(args,workDir):
+    results = []
+    for lang in args.languages:
+        for numTokens in args.tokens:
+            corpora = {}
+            for stage in args.stages:
+                _,languages,corpus,_ = stages[stage]
+                if lang not in languages:
+                    continue
+                if corpus not in corpora:
+                    corpora[corpus] = os.path.join(
+                        workDir, '%s-%d-%s.txt' % (lang,numTokens,corpus))
+                    write_corpus(corpora[corpus], lang, numTokens, args,
+                                 corpus == 'messy')
+                result = run_stage(stage, lang, corpora[corpus], numTokens,
+                                   workDir, args.repeat)
+                results.append(result)
+                print('%-14s %s %10d tokens %9.2f s %8.1f MB %12.0f tokens/s'
+                      % (stage, lang, numTokens, result['wall_s'],
+                         result['peak_rss_mb'], result['tokens_per_s']))
+            for path in corpora.values():
+                os.remove(path)
+    return results
+
+
+def parse_user_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o','--outfile', type=str, default='results.json',
+                        help='where to write the results')
+    parser.add_argument('-t','--tokens', type=int, nargs='+',
+                        default=[10000,100000,1000000],
+                        help='corpus sizes (in words) to run every stage at')
+    parser.add_argument('-l','--languages', type=str, nargs='+',
+                        default=['ky','tr'], choices=['ky','tr'])
+    parser.add_argument('-s','--stages', type=str, nargs='+',
+                        default=sorted(stages), choices=sorted(stages))
+    parser.add_argument('-v','--vocab', type=int, default=50000,
+                        help='number of distinct words in the corpora')
+    parser.add_argument('-z','--zipf', type=float, default=1.0,
+                        help='exponent of the Zipfian word distribution')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('-r','--repeat', type=int, default=1,
+                        help='runs of every stage (the fastest one is kept)')
+    parser.add_argument('-w','--workdir', type=str, default=None,
+                        help='where to write the corpora and outputs '
+                        '(default: a temporary directory)')
+    args = parser.parse_args()
+    return args
+
+if __name__ == '__main__':
+    args = parse_user_args()
+    meta = {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': get_git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'args': vars(args)}
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        results = run_benchmarks(args, os.path.abspath(args.workdir))
+    else:
+        with tempfile.TemporaryDirectory() as workDir:
+            results = run_benchmarks(args, workDir)
+    with open(args.outfile, 'w', encoding='utf-8') as outFile:
+        json.dump({'meta': meta, 'results': results}, outFile, indent=2,
+                  ensure_ascii=False)
+        outFile.write('\n')
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+#
+# USAGE: $python3 pipeline.py messy_corpus.txt [--preset kaldi|stk] [-n N]
+#                             [--min-length L] [--graphemes|--rules]
+#                             [-C WORKDIR] [--cache DIR] [-j JOBS] [--force]
+#
+#
+# INPUT: (1) some messy text corpus (command line argument)
+#
+# OUTPUT: (1) the cleaned corpus, the pronunciation dictionary and list of
+#             phones, and the ngram language model (see main.sh)
+#
+# FUNCTION:
+#    Run clean -> (make_dict + sort, make_lm) as a graph of stages. Each stage
+#    is keyed by the hash of its commands and the contents of its inputs (the
+#    scripts included), and its outputs are stored under that key in a local
+#    cache. When nothing upstream of a stage changed its outputs are copied
+#    back from the cache instead of being rebuilt. Stages which don't depend
+#    on each other run concurrently.
+#
+
+#
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import time
+import sys
+
+# the progress lines are the ones of the language model scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..','language-model'))
+from instrument import log
+
+# commands are argv lists, run in order in the working directory; if stdout
+# is given, the output of the commands is written to that file
+Stage = namedtuple('Stage', ['name','commands','inputs','outputs','stdout'])
+
+BLOCK_SIZE = 2**20
+
+presets = {
+    'kaldi': {'minSentenceLength': 25,
+              'addSilence': 1,
+              'silence_word': '<SIL>',
+              'silence_phone': 'SIL',
+              'unknown_word': '<unk>',
+              'unknown_phone': 'SPOKEN_NOISE',
+              'graphemes': True,
+              'nosil': True,
+              'ngramOrder': 3},
+    'stk': {'minSentenceLength': 0,
+            'addSilence': 1,
+            'silence_word': '[silence]',
+            'silence_phone': '.',
+            'unknown_word': '<unk>',
+            'unknown_phone': '@',
+            'graphemes': False,
+            'nosil': False,
+            'ngramOrder': 1}}
+
+clean_corpus = 'clean.txt'
+phoneticDict = 'lexicon.txt'
+phoneticDict_NOSIL = 'lexicon_nosil.txt'
+phonesList = 'phones.txt'
+ngramFile = 'task.arpabo'
+
+
+def get_stages(messy_corpus,settings):
+    '''
+    Return the stages of main.sh given the settings of a preset.
+    '''
+    dictFiles = [phoneticDict,phonesList]
+    makeDict = ['./make_dict.pl',
+                '--clean_corpus', clean_corpus,
+                '--phoneticDict', phoneticDict,
+                '--phonesList', phonesList,
+                '--silence_word', settings['silence_word'],
+                '--silence_phone', settings['silence_phone'],
+                '--unknown_word', settings['unknown_word'],
+                '--unknown_phone', settings['unknown_phone']]
+    if settings['nosil']:
+        dictFiles.insert(1,phoneticDict_NOSIL)
+        makeDict += ['--phoneticDict_NOSIL', phoneticDict_NOSIL]
+    if settings['graphemes']:
+        makeDict.append('--graphemes')
+    # sort files by bytes (kaldi-style) and re-save them with orginal filename
+    sortDict = [['env','LC_ALL=C','sort','-i',fileName,'-o',fileName]
+                for fileName in dictFiles]
+
+    return [Stage('clean',
+                  [['./clean_text.pl', messy_corpus,
+                    str(settings['minSentenceLength']),
+                    str(settings['addSilence'])]],
+                  [messy_corpus,'clean_text.pl'], [clean_corpus], clean_corpus),
+            Stage('dict', [makeDict]+sortDict,
+                  [clean_corpus,'make_dict.pl'], dictFiles, None),
+            Stage('lm',
+                  [['./make_lm.sh', clean_corpus, ngramFile,
+                    str(settings['ngramOrder'])]],
+                  [clean_corpus,'make_lm.sh'], [ngramFile], None)]
+
+
+def get_file_hash(path):
+    fileHash = hashlib.sha256()
+    with open(path,'rb') as inFile:
+        for block in iter(lambda: inFile.read(BLOCK_SIZE), b''):
+            fileHash.update(block)
+    return fileHash.hexdigest()
+
+
+def get_stage_key(stage,workDir):
+    '''
+    Hash a stage's commands together with the contents of its inputs.
+    '''
+    description = {'name':stage.name, 'commands':stage.commands,
+                   'stdout':stage.stdout,
+                   'inputs':[(path,get_file_hash(os.path.join(workDir,path)))
+                             for path in stage.inputs]}
+    return hashlib.sha256(json.dumps(description, sort_keys=True)
+                          .encode('utf-8')).hexdigest()
+
+
+def copy_file(src,dst):
+    # copy next to dst first, so dst is never left half-written
+    tmpPath = dst + '.tmp'
+    shutil.copyfile(src,tmpPath)
+    os.replace(tmpPath,dst)
+
+
+def run_stage(stage,workDir,cacheDir,force):
+    '''
+    Bring a stage's outputs up to date: copy them from the cache if a run of
+    the stage with the same key is stored there, otherwise run the stage and
+    store its outputs. Returns True if the stage was run.
+    '''
+    key = get_stage_key(stage,workDir)
+    stageCache = os.path.join(cacheDir,stage.name+'-'+key)
+    if os.path.isdir(stageCache) and not force:
+        for path in stage.outputs:
+            copy_file(os.path.join(stageCache,os.path.basename(path)),
+                      os.path.join(workDir,path))
+        return False
+
+    # delete old versions of the files this stage makes, since some of the
+    # scripts append to their outputs
+    for path in stage.outputs:
+        if os.path.exists(os.path.join(workDir,path)):
+            os.remove(os.path.join(workDir,path))
+    stdout = None
+    if stage.stdout:
+        stdout = open(os.path.join(workDir,stage.stdout),'wb')
+    try:
+        for command in stage.commands:
+            subprocess.run(command, cwd=workDir, stdout=stdout, check=True)
+    finally:
+        if stdout:
+            stdout.close()
+
+    tmpCache = stageCache + '.tmp'
+    shutil.rmtree(tmpCache, ignore_errors=True)
+    os.makedirs(tmpCache)
+    for path in stage.outputs:
+        shutil.copyfile(os.path.join(workDir,path),
+                        os.path.join(tmpCache,os.path.basename(path)))
+    shutil.rmtree(stageCache, ignore_errors=True)
+    os.replace(tmpCache,stageCache)
+    return True
+
+
+def get_dependencies(stages):
+    '''
+    A stage depends on the stages which make any of its inputs.
+    '''
+    makers = {path: stage.name for stage in stages for path in stage.outputs}
+    return {stage.name: set(makers[path] for path in stage.inputs
+                            if path in makers)
+            for stage in stages}
+
+
+def run_pipeline(stages,workDir,cacheDir,startTime,jobs=2,force=False):
+    '''
+    Run the stages in the order of their dependencies, with up to jobs stages
+    running at once.
+    '''
+    dependencies = get_dependencies(stages)
+    todo = {stage.name: stage for stage in stages}
+    done = set()
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while todo or running:
+            for name,stage in list(todo.items()):
+                if dependencies[name] <= done:
+                    running[executor.submit(run_stage,stage,workDir,cacheDir,
+                                            force)] = name
+                    del todo[name]
+            if not running:
+                raise ValueError('cyclic dependencies between stages: '
+                                 + ', '.join(sorted(todo)))
+            finished,_ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                status = 'rebuilt' if future.result() else 'cached'
+                done.add(name)
+                log(startTime, 'Stage '+ name + ' ' + status)
+
+
+def parse_user_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('messy_corpus', type=str, help='some messy text corpus')
+    parser.add_argument('--preset', type=str, default='kaldi',
+                        choices=sorted(presets),
+                        help='settings of kaldi-style/main.sh or '
+                        'stk-style/main.sh')
+    parser.add_argument('-n','--order', type=int, default=None,
+                        help='order of the ngram language model')
+    parser.add_argument('--min-length', type=int, default=None,
+                        help='minimum sentence length kept by clean_text.pl')
+    phones = parser.add_mutually_exclusive_group()
+    phones.add_argument('--graphemes', dest='graphemes', action='store_const',
+                        const=True, default=None,
+                        help='one phone per letter in the dictionary')
+    phones.add_argument('--rules', dest='graphemes', action='store_const',
+                        const=False,
+                        help='context dependent phones in the dictionary')
+    parser.add_argument('-C','--workdir', type=str, default='.',
+                        help='directory with the scripts and the outputs')
+    parser.add_argument('--cache', type=str, default=None,
+                        help='cache directory (default: WORKDIR/.pipeline-cache)')
+    parser.add_argument('-j','--jobs', type=int, default=2,
+                        help='number of stages run at once')
+    parser.add_argument('--force', action='store_true',
+                        help='rebuild every stage, ignoring the cache')
+    args = parser.parse_args()
+    return args
+
+if __name__ == '__main__':
+    args = parse_user_args()
+    startTime = time.time()
+    settings = dict(presets[args.preset])
+    if args.order is not None:
+        settings['ngramOrder'] = args.order
+    if args.min_length is not None:
+        settings['minSentenceLength'] = args.min_length
+    if args.graphemes is not None:
+        settings['graphemes'] = args.graphemes
+
+    workDir = os.path.abspath(args.workdir)
+    cacheDir = args.cache or os.path.join(workDir,'.pipeline-cache')
+    # the corpus is given relative to where we are, the stages run in workDir
+    messy_corpus = os.path.relpath(os.path.abspath(args.messy_corpus),workDir)
+
+    stages = get_stages(messy_corpus,settings)
+    run_pipeline(stages,workDir,cacheDir,startTime,args.jobs,args.force)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+#
+# USAGE: $python3 syllables.py -l ky|tr clean_corpus.txt [-o output.txt] [-j N]
+#
+#
+# INPUT: (1) a cleaned text corpus (command line argument)
+#
+# OUTPUT: (1) words broken up by syllable (output.txt), with "@ @" between
+#             the syllables of a word
+#
+
+#
+
+from functools import lru_cache, partial
+from multiprocessing import Pool
+import argparse
+import re
+
+# lines handed to a worker at a time when splitting with several jobs
+CHUNK_SIZE = 10000
+
+languages = {
+    'ky': {'consonants': "пбдткгхшщжзсцчйлмнңфвръь",
+           'vowels': "иеэөүаоуы",
+           'glides': "ёяюе",
+           'lowercase': False},
+    'tr': {'consonants': "bcçdfgğhjklmnprsştvyz",
+           'vowels': "aâeıiîoöuûü",
+           'glides': "",
+           'lowercase': True}}
+
+
+def compile_syllable_rules(consonants,vowels,glides):
+    '''
+    Compile the syllable rules into a single regex which matches the empty
+    string at every syllable boundary of a word, so that a word is split in
+    one pass over it:
+
+        VCV  --> V@ @CV
+        VCCV --> VC@ @CV
+        VCCC --> VCC@ @C
+        VGV  --> V@ @GV   (only for languages with glides)
+
+    where the first V may also be a glide.
+    '''
+    C = '['+consonants+']'
+    V = '['+vowels+']'
+    onset = '['+vowels+glides+']'
+    rules = ['(?<='+onset+')(?='+C+V+')',
+             '(?<='+onset+C+')(?='+C+V+')',
+             '(?<='+onset+C+C+')(?='+C+')']
+    if glides:
+        rules.append('(?<='+onset+')(?=['+glides+'])')
+    return re.compile('|'.join(rules))
+
+
+syllable_rules = {lang: compile_syllable_rules(letters['consonants'],
+                                               letters['vowels'],
+                                               letters['glides'])
+                  for lang,letters in languages.items()}
+
+
+@lru_cache(maxsize=2**18)
+def split_word(word,lang):
+    '''
+    Return word with "@ @" inserted between its syllables. Corpora are
+    Zipfian, so the split words are memoized.
+    '''
+    return syllable_rules[lang].sub('@ @',word)
+
+
+def split_line(line,lang):
+    '''
+    Split all the words of a line into syllables, and return the line as
+    written to the output: every word followed by a space.
+    '''
+    if languages[lang]['lowercase']:
+        line = line.lower()
+    return ''.join([split_word(word,lang)+' ' for word in line.split()])+'\n'
+
+
+def split_lines(lines,lang):
+    '''
+    Lazily split an iterable of lines into syllables.
+    '''
+    for line in lines:
+        yield split_line(line,lang)
+
+
+def split_chunk(lines,lang):
+    return ''.join(split_lines(lines,lang))
+
+
+def read_line_chunks(inFile,chunkSize=CHUNK_SIZE):
+    chunk = []
+    for line in inFile:
+        chunk.append(line)
+        if len(chunk) == chunkSize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def split_file(fileName,lang,outPath='output.txt',jobs=1):
+    '''
+    Stream fileName into outPath split into syllables, splitting chunks of
+    lines in jobs processes (the output keeps the order of the input).
+    '''
+    with open(fileName, 'r', encoding='utf-8') as inFile, \
+         open(outPath, 'w', encoding='utf-8') as outFile:
+        if jobs > 1:
+            with Pool(jobs) as pool:
+                for chunk in pool.imap(partial(split_chunk,lang=lang),
+                                       read_line_chunks(inFile)):
+                    outFile.write(chunk)
+        else:
+            outFile.writelines(split_lines(inFile,lang))
+
+
+def parse_user_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('infile', type=str, help='the cleaned text corpus')
+    parser.add_argument('-l','--language', type=str, required=True,
+                        choices=sorted(languages), help='language of corpus')
+    parser.add_argument('-o','--outfile', type=str, default='output.txt',
+                        help='the output text file')
+    parser.add_argument('-j','--jobs', type=int, default=1,
+                        help='number of processes splitting lines')
+    args = parser.parse_args()
+    return args
+
+if __name__ == '__main__':
+    args = parse_user_args()
+    split_file(args.infile, args.language, args.outfile, args.jobs)
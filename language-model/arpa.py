@@ -0,0 +1,133 @@
+'''
+Reading and writing n-gram models in ARPA format.
+
+The writer works straight on the integer count tables from corpus_stats and
+parallel arrays of (natural log) probabilities and backoff weights. Every
+order is written in chunks: the words of a chunk are looked up for a whole
+column at once, the lines are formatted with one fixed-precision template,
+and each chunk goes to the file in a single write. Paths ending in .gz are
+written gzipped.
+'''
+
+from corpus_stats import get_row_keys
+from array import array
+from instrument import log
+import numpy as np
+import gzip
+
+# ARPA files hold log10 values, everything in here is computed with np.log
+LOG10E = np.log10(np.e)
+# what ARPA uses for log10(0)
+LOG_ZERO = -99.
+CHUNK_SIZE = 100000
+
+
+def open_lm_file(path,mode='rt'):
+    '''
+    Open a (possibly gzipped) text file for reading or writing as UTF-8.
+    '''
+    if path.endswith('.gz'):
+        return gzip.open(path,mode,encoding='utf-8',compresslevel=6)
+    return open(path,mode,encoding='utf-8')
+
+
+def format_ngrams(vocabArray,ngramIds,logProbs,logBows,precision):
+    '''
+    Return the ARPA lines (one string) for a chunk of n-grams.
+    '''
+    words = vocabArray[ngramIds]
+    texts = words[:,0]
+    for column in range(1,ngramIds.shape[1]):
+        texts = texts + ' ' + words[:,column]
+    probs = np.maximum(logProbs*LOG10E,LOG_ZERO)
+    if logBows is None:
+        template = '%.' +str(precision)+ 'f %s\n'
+        return ''.join([template % line for line in zip(probs.tolist(),
+                                                        texts)])
+    bows = np.maximum(logBows*LOG10E,LOG_ZERO)
+    template = '%.' +str(precision)+ 'f %s %.' +str(precision)+ 'f\n'
+    return ''.join([template % line for line in zip(probs.tolist(),texts,
+                                                    bows.tolist())])
+
+
+def write_arpa(outPath,vocab,tables,logProbs,logBows,startTime,precision=6):
+    '''
+    Write a model in ARPA format.
+    Input:
+        (1) the path to write to, gzipped if it ends in .gz
+        (2) the vocabulary (vocab[ID] = word)
+        (3) the list of (ngramIds, counts) tables, tables[n-1] for order n
+        (4) the (natural log) probability of every n-gram, one array per order
+        (5) the (natural log) backoff weight of every n-gram, one array per
+            order except the highest, or None to write no backoff weights
+    '''
+    vocabArray = np.array(vocab,dtype=object)
+    order = len(tables)
+    with open_lm_file(outPath,'wt') as outFile:
+        outFile.write('\n\\data\\\n')
+        for n,(ngramIds,counts) in enumerate(tables,1):
+            outFile.write('ngram ' +str(n)+ '=' +str(len(ngramIds))+ '\n')
+        for n,(ngramIds,counts) in enumerate(tables,1):
+            outFile.write('\n\\' +str(n)+ '-grams:\n')
+            for start in range(0,len(ngramIds),CHUNK_SIZE):
+                end = start + CHUNK_SIZE
+                if logBows is None or n == order:
+                    chunkBows = None
+                else:
+                    chunkBows = logBows[n-1][start:end]
+                outFile.write(format_ngrams(vocabArray,ngramIds[start:end],
+                                            logProbs[n-1][start:end],
+                                            chunkBows,precision))
+        outFile.write('\n\\end\\\n')
+    log(startTime, 'successfully printed model to ' +outPath)
+
+
+def read_arpa(arpaPath):
+    '''
+    Read a (possibly gzipped) ARPA model. Returns:
+        (1) the sorted vocabulary (vocab[ID] = word)
+        (2) for every order, an (M x n) array of word IDs, sorted
+            lexicographically
+        (3) for every order, the log10 probabilities
+        (4) for every order, the log10 backoff weights (0 where none given)
+    '''
+    wordIndex = {}
+    ngramIds = []
+    logProbs = []
+    logBows = []
+    n = 0
+    with open_lm_file(arpaPath) as arpaFile:
+        for line in arpaFile:
+            line = line.strip()
+            if not line or line.startswith('ngram '):
+                continue
+            if line.startswith('\\'):
+                if line.endswith('-grams:'):
+                    n = int(line[1:-len('-grams:')])
+                    ngramIds.append(array('i'))
+                    logProbs.append(array('d'))
+                    logBows.append(array('d'))
+                elif line == '\\end\\':
+                    break
+                continue
+            if n == 0:
+                continue
+            fields = line.split()
+            if n == 1:
+                wordIndex.setdefault(fields[1],len(wordIndex))
+            ngramIds[n-1].extend([wordIndex[word] for word in fields[1:n+1]])
+            logProbs[n-1].append(float(fields[0]))
+            logBows[n-1].append(float(fields[n+1]) if len(fields) > n+1
+                                else 0.)
+
+    vocab = sorted(wordIndex)
+    renumber = np.empty(len(vocab), dtype=np.int32)
+    renumber[[wordIndex[word] for word in vocab]] = np.arange(len(vocab))
+    for i in range(len(ngramIds)):
+        ids = renumber[np.frombuffer(ngramIds[i],dtype=np.int32)
+                       .reshape(-1,i+1)]
+        order = np.argsort(get_row_keys(ids,len(vocab)),kind='stable')
+        ngramIds[i] = ids[order]
+        logProbs[i] = np.frombuffer(logProbs[i])[order]
+        logBows[i] = np.frombuffer(logBows[i])[order]
+    return vocab, ngramIds, logProbs, logBows
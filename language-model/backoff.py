@@ -1,41 +1,94 @@
+from corpus_stats import find_rows, get_context_groups, get_unigram_counts
 import numpy as np
 
+# smallest probability mass a context may have left over for backing off,
+# keeps the backoff weights finite when the discounts take away next to nothing
+MIN_MASS = 1e-10
 
-def get_brants_bow_dict(ngramDict, alpha=.4):
-    ''' 
-    based on Brants etal 2007, assuming that 
-    the original probabilities are already logged.
-    '''
-    bow_dict={}
-    for key,value in ngramDict.items():
-        bow_dict[key] = (value, np.log(alpha)+value)
-    return bow_dict
-
-
-def get_katz_bow_dict(uniProbDict,biProbDict,triProbDict,startTime):
-    ''' based on Katz 1987 '''
-    bowDict={}
-    for uniKey,uniValue in uniProbDict.items():
-        numerator = 0
-        denominator = 0
-        for biKey,biValue in biProbDict.items():
-            if biKey[0] == uniKey[0]:
-                numerator += biValue
-                denominator += uniValue
-        alpha = (1-numerator/1-denominator)
-        bowDict[uniKey] = alpha*uniValue
-    print('[  '+ str("%.2f" % (time.time()-startTime)) +'  \t]'+
-          ' 2-gram backoff model made')
-    for biKey,biValue in biProbDict.items():
-        numerator=0
-        denominator=0
-        for triKey,triValue in triProbDict.items():
-            if triKey[0:2] == biKey[:]:
-                numerator += triValue
-                denominator += biValue
-        alpha = 1-(numerator/denominator)
-        bowDict[biKey] = alpha*biValue
-        
-    print('[  '+ str("%.2f" % (time.time()-startTime)) +'  \t]'+
-          ' 3-gram backoff model made')
-    return bowDict
+
+def get_brants_bow_array(logProbs, alpha=.4):
+    '''
+    based on Brants etal 2007, assuming that the original probabilities are
+    already logged: returns the array of (logged) backoff weights.
+    '''
+    return np.log(alpha)+logProbs
+
+
+def get_katz_prob_arrays(tables, vocabSize, k=5, startId=None):
+    '''
+    Given the count tables, return the (logged) Good-Turing discounted
+    conditional probabilities of Katz 1987, one array per order. Counts above
+    k are trusted as they are, counts r <= k are discounted by
+
+        d_r = (r*/r - (k+1)n_{k+1}/n_1) / (1 - (k+1)n_{k+1}/n_1)
+
+    where r* = (r+1) n_{r+1}/n_r. Unigrams are not discounted, and <s> (the
+    word startId) gets no unigram probability (see get_unigram_counts()).
+    '''
+    uniCounts = get_unigram_counts(tables,startId)
+    with np.errstate(divide='ignore'):
+        logProbs = [np.log(uniCounts/uniCounts.sum())]
+    for n in range(2,len(tables)+1):
+        contextIds, contextCounts = tables[n-2]
+        ngramIds, counts = tables[n-1]
+        discounts = get_katz_discounts(counts,k)
+        rows = find_rows(contextIds,ngramIds[:,:-1],vocabSize)
+        logProbs.append(np.log(discounts[np.minimum(counts,k+1)]*counts/
+                               contextCounts[rows]))
+    return logProbs
+
+
+def get_katz_discounts(counts, k=5):
+    '''
+    Return the Good-Turing discount d_r of every count r <= k as an array
+    indexed by r, with a discount of 1 at index k+1 for all larger counts.
+    If the counts-of-counts make a discount meaningless (e.g. no n-grams seen
+    r+1 times) the count is left undiscounted.
+    '''
+    countsOfCounts = np.bincount(counts,minlength=k+3)
+    discounts = np.ones(k+2)
+    if not countsOfCounts[1]:
+        return discounts
+    common = (k+1)*countsOfCounts[k+1]/countsOfCounts[1]
+    for r in range(1,k+1):
+        if countsOfCounts[r] and countsOfCounts[r+1] and common < 1:
+            rStar = (r+1)*countsOfCounts[r+1]/countsOfCounts[r]
+            discount = (rStar/r - common)/(1 - common)
+            if 0 < discount <= 1:
+                discounts[r] = discount
+    return discounts
+
+
+def get_katz_bow_arrays(tables, logProbs, vocabSize):
+    '''
+    based on Katz 1987
+
+    Given the (logged, discounted) probability of every n-gram as one array
+    per order, return the (logged) backoff weight of every n-gram of the
+    orders 1..n-1. The backoff weight of a context h with lower order context
+    h' is the probability mass left over after its seen continuations,
+    normalized by the lower order mass of those same continuations:
+
+        alpha(h) = (1 - sum_w P(w|h)) / (1 - sum_w P(w|h'))
+
+    with both sums over the words w seen after h. The n-grams sharing a
+    context are next to each other in a sorted table, so the sums of each
+    context are one np.add.reduceat() per order. n-grams never seen as a
+    context back off with a weight of 1.
+    '''
+    logBows = []
+    for n in range(2,len(tables)+1):
+        ngramIds = tables[n-1][0]
+        lowerIds = tables[n-2][0]
+        logBow = np.zeros(len(lowerIds))
+        if len(ngramIds):
+            starts, groups = get_context_groups(ngramIds)
+            numerators = np.add.reduceat(np.exp(logProbs[n-1]),starts)
+            lowerRows = find_rows(lowerIds,ngramIds[:,1:],vocabSize)
+            denominators = np.add.reduceat(np.exp(logProbs[n-2][lowerRows]),
+                                           starts)
+            contextRows = find_rows(lowerIds,ngramIds[starts,:-1],vocabSize)
+            logBow[contextRows] = np.log(np.maximum(1-numerators,MIN_MASS)/
+                                         np.maximum(1-denominators,MIN_MASS))
+        logBows.append(logBow)
+    return logBows
@@ -0,0 +1,180 @@
+'''
+USAGE:$ python3 binary_lm.py -i MODEL.arpa[.gz] -o MODEL.bin
+
+DESCRIPTION: A compact binary n-gram model which can be memory-mapped.
+
+The file is a short header followed by flat arrays, each aligned to 8 bytes:
+
+    magic (8 bytes) | header length (8 bytes, little endian) | JSON header |
+    vocab offsets | vocab bytes | per order: word IDs, log10 prob, log10 bow
+
+The vocabulary is stored sorted, as one block of UTF-8 bytes plus the offset
+of each word, so a word's ID is found by binary search without decoding the
+vocabulary. The n-grams of every order are an (M x n) int32 array sorted
+lexicographically, with float32 probability and backoff columns. Loading
+just maps the file and points NumPy arrays into it: nothing is parsed or
+copied, and processes loading the same file share its pages.
+'''
+
+from arpa import read_arpa, LOG10E, LOG_ZERO
+from instrument import log
+import numpy as np
+import argparse
+import json
+import mmap
+import time
+
+MAGIC = b'ASRLM\x00\x01\x00'
+ALIGNMENT = 8
+
+
+def write_binary_lm(binPath,vocab,ngramIds,logProbs,logBows):
+    '''
+    Write a model to the binary format. vocab must be sorted, ngramIds[n-1]
+    is the sorted (M x n) array of word IDs of order n, and logProbs and
+    logBows hold the parallel log10 probabilities and backoff weights (the
+    backoff weights of the highest order are not stored).
+    '''
+    encoded = [word.encode('utf-8') for word in vocab]
+    vocabOffsets = np.zeros(len(vocab)+1,dtype=np.int64)
+    np.cumsum([len(word) for word in encoded],out=vocabOffsets[1:])
+    if vocabOffsets[-1] < 2**32:
+        vocabOffsets = vocabOffsets.astype(np.uint32)
+    arrays = [('vocab_offsets',vocabOffsets),
+              ('vocab_bytes',np.frombuffer(b''.join(encoded),dtype=np.uint8))]
+    order = len(ngramIds)
+    for n in range(1,order+1):
+        arrays.append(('ids_'+str(n),
+                       np.ascontiguousarray(ngramIds[n-1],dtype=np.int32)))
+        arrays.append(('prob_'+str(n),
+                       np.asarray(logProbs[n-1],dtype=np.float32)))
+        if n < order:
+            arrays.append(('bow_'+str(n),
+                           np.asarray(logBows[n-1],dtype=np.float32)))
+
+    # lay out the arrays after a header of known size
+    sections = {}
+    offset = 0
+    for name,values in arrays:
+        sections[name] = {'dtype': values.dtype.str, 'shape': values.shape,
+                          'offset': offset}
+        offset += -(-values.nbytes//ALIGNMENT)*ALIGNMENT
+    header = json.dumps({'order': order, 'sections': sections}).encode()
+    header += b' '*(-len(header) % ALIGNMENT)
+    dataStart = len(MAGIC) + 8 + len(header)
+
+    with open(binPath,'wb') as binFile:
+        binFile.write(MAGIC)
+        binFile.write(len(header).to_bytes(8,'little'))
+        binFile.write(header)
+        for name,values in arrays:
+            binFile.seek(dataStart + sections[name]['offset'])
+            binFile.write(values.tobytes())
+        # pad the last array out to its aligned size
+        binFile.truncate(dataStart + offset)
+
+
+def write_binary_lm_from_tables(binPath,vocab,tables,logProbs,logBows):
+    '''
+    Same as write_binary_lm(), but takes what arpa.write_arpa() takes: the
+    count tables and natural log probabilities and backoff weights (or None
+    for no backoff weights), as built by ngrams.py.
+    '''
+    ngramIds = [ngramIds for ngramIds,counts in tables]
+    if logBows is None:
+        logBows = [np.zeros(len(ids)) for ids in ngramIds[:-1]]
+    write_binary_lm(binPath,vocab,ngramIds,
+                    [np.maximum(logProb*LOG10E,LOG_ZERO) for logProb in logProbs],
+                    [np.maximum(logBow*LOG10E,LOG_ZERO) for logBow in logBows])
+
+
+def load_binary_lm(binPath):
+    '''
+    Memory-map a binary model. Returns a dictionary with the model order, the
+    vocab_offsets and vocab_bytes arrays (see get_word_id() and get_word()),
+    and lists 'ids', 'probs' and 'bows' of arrays per order, all of them
+    read-only views into the mapped file.
+    '''
+    with open(binPath,'rb') as binFile:
+        mapped = mmap.mmap(binFile.fileno(),0,access=mmap.ACCESS_READ)
+    if mapped[:len(MAGIC)] != MAGIC:
+        raise ValueError(binPath + ' is not a binary language model')
+    headerLength = int.from_bytes(mapped[len(MAGIC):len(MAGIC)+8],'little')
+    dataStart = len(MAGIC) + 8 + headerLength
+    header = json.loads(mapped[len(MAGIC)+8:dataStart].decode())
+
+    def section(name):
+        info = header['sections'][name]
+        count = int(np.prod(info['shape']))
+        return np.frombuffer(mapped,dtype=np.dtype(info['dtype']),count=count,
+                             offset=dataStart+info['offset']
+                             ).reshape(info['shape'])
+
+    order = header['order']
+    return {'order': order,
+            'mmap': mapped,
+            'vocab_offsets': section('vocab_offsets'),
+            'vocab_bytes': section('vocab_bytes'),
+            'ids': [section('ids_'+str(n)) for n in range(1,order+1)],
+            'probs': [section('prob_'+str(n)) for n in range(1,order+1)],
+            'bows': [section('bow_'+str(n)) for n in range(1,order)]}
+
+
+def get_word(lm,wordId):
+    '''
+    Return the word with the given ID from a loaded model.
+    '''
+    offsets = lm['vocab_offsets']
+    return bytes(lm['vocab_bytes'][offsets[wordId]:offsets[wordId+1]]
+                 ).decode('utf-8')
+
+
+def get_word_id(lm,word):
+    '''
+    Binary search the sorted vocabulary of a loaded model for a word. Returns
+    its ID, or None if the word isn't in the vocabulary. (UTF-8 bytes sort in
+    the same order as the code points of the words.)
+    '''
+    target = word.encode('utf-8')
+    offsets = lm['vocab_offsets']
+    vocabBytes = lm['vocab_bytes']
+    low, high = 0, len(offsets)-1
+    while low < high:
+        middle = (low+high)//2
+        if bytes(vocabBytes[offsets[middle]:offsets[middle+1]]) < target:
+            low = middle+1
+        else:
+            high = middle
+    if (low < len(offsets)-1 and
+        bytes(vocabBytes[offsets[low]:offsets[low+1]]) == target):
+        return low
+    return None
+
+
+def convert_arpa_to_binary(arpaPath,binPath):
+    vocab, ngramIds, logProbs, logBows = read_arpa(arpaPath)
+    write_binary_lm(binPath,vocab,ngramIds,logProbs,logBows)
+    return vocab, ngramIds
+
+
+def parse_user_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i','--infile', type=str, required=True,
+                        help='the ARPA model (may be gzipped)')
+    parser.add_argument('-o','--outfile', type=str, required=True,
+                        help='where to write the binary model')
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_user_args()
+    startTime = time.time()
+    vocab, ngramIds = convert_arpa_to_binary(args.infile,args.outfile)
+    log(startTime, 'converted a model of ' +str(len(vocab))+ ' words and ' +
+        ' + '.join(str(len(ids)) for ids in ngramIds)+ ' n-grams to ' +
+        args.outfile)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 '''
-USE: python3 clean_text.py /path/to/corpus.txt
+USE: python3 clean_text.py /path/to/corpus.txt [-o OUTFILE] [-j JOBS]
+                                               [-l LANGUAGE]
 
 FUNCTION:
   Given a path to a text file, this script will:
@@ -7,13 +8,29 @@ FUNCTION:
    (2) tokenize each line (see function tokenize_line()
    (3) print new, cleaned lines to output file
 
-OUTPUT: output.txt (text file with one sentence per line, no non-alphabetic
-                    characters, all lowercase words, only Kyrgyz characters)
+  The file is read in chunks (cut after a sentence boundary) and the chunks
+  are cleaned by JOBS worker processes, keeping their order, so the output
+  is the same as cleaning the whole file at once.
+
+OUTPUT: OUTFILE, by default output.txt, or stdout if OUTFILE is -
+        (text file with one sentence per line, no non-alphabetic
+         characters, all lowercase words, only letters of LANGUAGE)
 '''
 
 
+from multiprocessing import Pool
+from functools import partial
+import argparse
+import sys
 import re
 
+# where sentences end
+SENTENCE_END = re.compile(r'[.+!?\n]')
+# everything that isn't a letter
+NON_LETTERS = re.compile('[\W_0-9]+', re.UNICODE)
+# how many characters to read at a time
+CHUNK_SIZE = 2**20
+
 def split_sentences_in_file(fileName):
     '''
     Given a path to a text file:
@@ -33,24 +50,78 @@ def split_sentences_in_file(fileName):
     outFile.close()
 
 
-def clean_lines_in_file(fileName,kyrgyzLetters):
+def clean_lines_in_file(fileName,kyrgyzLetters,outPath='output.txt',jobs=1):
     '''
     Given a path to a text file:
     (1) split file into lines where sentences should be (see regex object)
     (2) tokenize each line (see function tokenize_line())
     (3) add each line as a character string to 'lines'
+    The file is streamed in chunks and, if jobs > 1, the chunks are cleaned
+    in parallel. outPath '-' means stdout.
     '''
-    regex = re.compile(r'[.+!?\n]')
-    outFile = open('output.txt', 'w')
+    cleanChunk = partial(clean_chunk, deleteLetters=
+                         get_letter_deletion_table(kyrgyzLetters))
+    if outPath == '-':
+        outFile = sys.stdout
+    else:
+        outFile = open(outPath, 'w')
     with open(fileName) as inFile:
-        content = inFile.read()
-        for line in re.split(regex,content):
-            line = tokenize_line(line,kyrgyzLetters)
-            if line != '':
-                print(line, file=outFile)
-            else:
-                pass
-    outFile.close()
+        chunks = read_sentence_chunks(inFile)
+        if jobs > 1:
+            with Pool(jobs) as pool:
+                for cleaned in pool.imap(cleanChunk, chunks):
+                    outFile.write(cleaned)
+        else:
+            for cleaned in map(cleanChunk, chunks):
+                outFile.write(cleaned)
+    if outFile is not sys.stdout:
+        outFile.close()
+
+
+def read_sentence_chunks(inFile,chunkSize=CHUNK_SIZE):
+    '''
+    Read a file about chunkSize characters at a time, cutting every chunk
+    right after its last sentence boundary and carrying the rest over to the
+    next chunk, so no sentence is ever split between two chunks.
+    '''
+    rest = ''
+    while True:
+        block = inFile.read(chunkSize)
+        if not block:
+            break
+        block = rest + block
+        cut = max(block.rfind(char) for char in '.+!?\n')
+        if cut == -1:
+            rest = block
+        else:
+            yield block[:cut+1]
+            rest = block[cut+1:]
+    if rest:
+        yield rest
+
+
+def get_letter_deletion_table(letters):
+    '''
+    A str.translate() table which deletes all the given letters: a token is
+    made only of those letters if nothing is left of it after translating.
+    '''
+    return str.maketrans('', '', ''.join(letters))
+
+
+def clean_chunk(chunk,deleteLetters):
+    '''
+    Split a chunk of text into sentences and clean them just like
+    tokenize_line() does, returning the cleaned lines as one string.
+    '''
+    lines = []
+    for line in SENTENCE_END.split(chunk):
+        tokens = [token for token in
+                  (NON_LETTERS.sub('', token)
+                   for token in line.lower().strip().split(' '))
+                  if token and not token.translate(deleteLetters)]
+        if tokens:
+            lines.append('<s> ' + ' '.join(tokens) + ' </s>\n')
+    return ''.join(lines)
 
 
 def tokenize_line(line,kyrgyzLetters):
@@ -62,10 +133,8 @@ def tokenize_line(line,kyrgyzLetters):
     (5) return tokens
     '''
     line = line.lower().strip().rstrip()
-    # regex pattern to match everything that isn't a letter
-    pattern = re.compile('[\W_0-9]+', re.UNICODE)
     # replace everything that isn't a letter or space
-    line = (' ').join([pattern.sub('', token) for token in line.split(' ')])
+    line = (' ').join([NON_LETTERS.sub('', token) for token in line.split(' ')])
     tokens=[]
     for token in line.split(' '):
         if token == '':
@@ -88,10 +157,32 @@ kyrgyzLetters = ['а','о','у','ы','и','е','э',
                 'м','н','ң','ф','в','р','ъ',
                 'ь']
 
+kazakhLetters = ['а','ә','о','ө','у','ұ','ү','ы','і','и','е','э',
+                 'ю','я','ё','п','б','д','т','к','қ','г','ғ','х',
+                 'һ','ш','щ','ж','з','с','ц','ч','й','л','м','н',
+                 'ң','ф','в','р','ъ','ь']
+
+alphabets = {'kyrgyz': kyrgyzLetters, 'kazakh': kazakhLetters}
+
+
+def parse_user_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('infile', type=str, help='the input text file')
+    parser.add_argument('-o','--outfile', type=str, default='output.txt',
+                        help='where to write the cleaned text (- for stdout)')
+    parser.add_argument('-j','--jobs', type=int, default=1,
+                        help='number of processes to clean with')
+    parser.add_argument('-l','--language', type=str, default='kyrgyz',
+                        choices=sorted(alphabets),
+                        help='keep only words written in this alphabet')
+    args = parser.parse_args()
+    return args
+
+
 def main():
-    import sys
-    infile = sys.argv[1]
-    clean_lines_in_file(infile, kyrgyzLetters)
+    args = parse_user_args()
+    clean_lines_in_file(args.infile, alphabets[args.language],
+                        outPath=args.outfile, jobs=args.jobs)
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,10 @@
 from collections import Counter
+from multiprocessing import Pool
+from array import array
+from instrument import log
 import numpy as np
-import time
+import io
+import os
 
 def get_count_dict(ngrams):
     '''
@@ -28,3 +32,309 @@ def get_MLE_dict(nMinus1GramDict,ngramDict,ngramOrder):
         MLEdict[ngram] = MLE
     return MLEdict
 
+
+##
+## Integer-encoded count tables
+##
+## Words are mapped to integer IDs (vocab[ID] = word), and every order of
+## n-grams is kept as a table: an (M x n) array of word IDs sorted
+## lexicographically, plus a parallel array of counts. The tuple dictionaries
+## above can always be recovered with table_to_dict().
+##
+
+def get_word_index(vocab):
+    '''
+    Given a vocabulary (a list of words, where the position is the ID), return
+    a dictionary mapping every word to its ID.
+    '''
+    return {word: i for i, word in enumerate(vocab)}
+
+
+def encode_corpus(fileName,lenSentenceCutoff):
+    '''
+    Stream a cleaned file line by line and map every token to an integer ID.
+    Returns:
+        (1) the vocabulary, sorted, so that IDs are the same from run to run
+        (2) a flat array of the word IDs of all kept lines
+        (3) an array of where each line starts in (2), plus the end position
+    '''
+    with open(fileName) as inFile:
+        return encode_lines(inFile,lenSentenceCutoff)
+
+
+def encode_lines(lines,lenSentenceCutoff):
+    '''
+    Same as encode_corpus(), but for any iterable of lines.
+    '''
+    wordIndex = {}
+    ids = array('i')
+    lineStarts = array('q',[0])
+    for line in lines:
+        tokens = line.rstrip('\n').split(' ')
+        if len(tokens) > lenSentenceCutoff:
+            for token in tokens:
+                # setdefault hands out the next free ID to unseen words
+                ids.append(wordIndex.setdefault(token,len(wordIndex)))
+            lineStarts.append(len(ids))
+    vocab = sorted(wordIndex)
+    # renumber the IDs so they follow the sorted vocabulary
+    renumber = np.empty(len(vocab), dtype=np.int32)
+    renumber[[wordIndex[word] for word in vocab]] = np.arange(len(vocab))
+    ids = renumber[np.frombuffer(ids, dtype=np.int32)]
+    return vocab, ids, np.frombuffer(lineStarts, dtype=np.int64)
+
+
+def get_ngram_ids(ids,lineStarts,n):
+    '''
+    Given the flat array of word IDs and the line boundaries from
+    encode_corpus(), return an (M x n) array of all n-grams which don't
+    cross a line boundary.
+    '''
+    if len(ids) < n:
+        return np.empty((0,n), dtype=np.int32)
+    windows = np.lib.stride_tricks.sliding_window_view(ids,n)
+    # position of the end of the line each window starts in
+    lineLengths = np.diff(lineStarts)
+    lineEnds = np.repeat(lineStarts[1:],lineLengths)[:len(windows)]
+    keep = np.arange(len(windows)) + n <= lineEnds
+    return windows[keep]
+
+
+def get_row_keys(ngramIds,vocabSize):
+    '''
+    Turn each row of an (M x n) array of word IDs into a single sortable key,
+    such that sorting the keys sorts the rows lexicographically. Rows are
+    packed into one int64 when vocabSize**n fits, otherwise the raw bytes of
+    the (big-endian) row are compared.
+    '''
+    n = ngramIds.shape[1]
+    if vocabSize**n < 2**63:
+        keys = np.zeros(len(ngramIds), dtype=np.int64)
+        for column in range(n):
+            keys *= vocabSize
+            keys += ngramIds[:,column]
+        return keys
+    rows = np.ascontiguousarray(ngramIds, dtype='>u4')
+    return rows.view('V'+str(4*n)).ravel()
+
+
+def count_ngram_ids(ngramIds,vocabSize):
+    '''
+    Count the distinct rows of an (M x n) array of word IDs with one
+    vectorized sort. Returns the sorted distinct n-grams and their counts.
+    '''
+    return sum_ngram_counts(ngramIds,None,vocabSize)
+
+
+def sum_ngram_counts(ngramIds,counts,vocabSize):
+    '''
+    Given an (M x n) array of word IDs, possibly with repeated rows, and the
+    count of each row, return the sorted distinct n-grams and their total
+    counts. If counts is None every row counts once.
+    '''
+    keys = get_row_keys(ngramIds,vocabSize)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    isFirst = np.ones(len(keys), dtype=bool)
+    isFirst[1:] = keys[1:] != keys[:-1]
+    starts = np.flatnonzero(isFirst)
+    if counts is None:
+        totals = np.diff(np.append(starts,len(keys)))
+    elif len(starts):
+        totals = np.add.reduceat(counts[order],starts)
+    else:
+        totals = counts[:0]
+    return ngramIds[order[starts]], totals.astype(np.int64)
+
+
+def count_encoded_corpus(vocab,ids,lineStarts,order):
+    '''
+    Given the output of encode_corpus(), return the list of (ngramIds, counts)
+    tables for the orders 1..order.
+    '''
+    return [count_ngram_ids(get_ngram_ids(ids,lineStarts,n),len(vocab))
+            for n in range(1,order+1)]
+
+
+def get_count_tables(fileName,order,startTime,lenSentenceCutoff):
+    '''
+    Encode a cleaned file and count all n-grams of order 1..order. Returns the
+    vocabulary and a list of (ngramIds, counts) tables, tables[n-1] holding
+    the n-grams.
+    '''
+    vocab, ids, lineStarts = encode_corpus(fileName,lenSentenceCutoff)
+    tables = count_encoded_corpus(vocab,ids,lineStarts,order)
+    print_table_totals(tables,startTime)
+    return vocab, tables
+
+
+def print_table_totals(tables,startTime):
+    for n,(ngramIds,counts) in enumerate(tables,1):
+        log(startTime, 'A total of ' +str(counts.sum())+ ' ' +str(n)+
+            '-grams found')
+
+
+##
+## Sharded counting
+##
+## The file is cut into shards at line boundaries, each shard is encoded and
+## counted in its own worker process, and the per-shard tables are merged.
+## The merged tables are identical to the ones from get_count_tables().
+##
+
+def get_shard_offsets(fileName,numShards):
+    '''
+    Return the byte offsets which cut a file into numShards pieces of about
+    the same size, moving every cut forward to the start of the next line.
+    '''
+    fileSize = os.path.getsize(fileName)
+    offsets = [0]
+    with open(fileName,'rb') as inFile:
+        for i in range(1,numShards):
+            inFile.seek(max(fileSize*i//numShards,offsets[-1]))
+            if inFile.tell() > 0:
+                # finish the line we landed in
+                inFile.seek(inFile.tell()-1)
+                inFile.readline()
+            offsets.append(inFile.tell())
+    offsets.append(fileSize)
+    return sorted(set(offsets))
+
+
+def count_shard(shard):
+    '''
+    Worker: encode and count the lines between two byte offsets of a file.
+    '''
+    fileName, start, end, order, lenSentenceCutoff = shard
+    with open(fileName,'rb') as inFile:
+        inFile.seek(start)
+        chunk = inFile.read(end-start)
+    # decode just like open() would, universal newlines included
+    lines = io.TextIOWrapper(io.BytesIO(chunk))
+    vocab, ids, lineStarts = encode_lines(lines,lenSentenceCutoff)
+    return vocab, count_encoded_corpus(vocab,ids,lineStarts,order)
+
+
+def merge_count_tables(countedShards):
+    '''
+    Given a list of (vocab, tables) pairs, each with its own vocabulary, map
+    them all onto one sorted vocabulary and sum the counts of every order.
+    '''
+    vocab = sorted(set(word for shardVocab, tables in countedShards
+                       for word in shardVocab))
+    wordIndex = get_word_index(vocab)
+    order = max(len(tables) for shardVocab, tables in countedShards)
+    mergedTables = []
+    for n in range(1,order+1):
+        allIds = []
+        allCounts = []
+        for shardVocab, tables in countedShards:
+            if len(tables) < n:
+                continue
+            remap = np.array([wordIndex[word] for word in shardVocab],
+                             dtype=np.int32)
+            ngramIds, counts = tables[n-1]
+            allIds.append(remap[ngramIds].reshape(-1,n))
+            allCounts.append(counts)
+        mergedTables.append(sum_ngram_counts(np.concatenate(allIds),
+                                             np.concatenate(allCounts),
+                                             len(vocab)))
+    return vocab, mergedTables
+
+
+def get_count_tables_parallel(fileName,order,startTime,lenSentenceCutoff,
+                              jobs,numShards=None):
+    '''
+    Same as get_count_tables(), but the file is split into shards (by default
+    four per job, to even out the load) which are counted in jobs worker
+    processes and then merged.
+    '''
+    if numShards is None:
+        numShards = 4*jobs
+    offsets = get_shard_offsets(fileName,numShards)
+    shards = [(fileName,start,end,order,lenSentenceCutoff)
+              for start,end in zip(offsets[:-1],offsets[1:])]
+    with Pool(jobs) as pool:
+        countedShards = pool.map(count_shard,shards)
+    log(startTime, 'counted ' +str(len(shards))+ ' shards in ' +str(jobs)+
+        ' processes')
+    if not countedShards:
+        countedShards = [count_shard((fileName,0,0,order,lenSentenceCutoff))]
+    vocab, tables = merge_count_tables(countedShards)
+    print_table_totals(tables,startTime)
+    return vocab, tables
+
+
+def find_rows(tableIds,queryIds,vocabSize):
+    '''
+    Given a sorted table of n-grams and an array of n-grams which are all in
+    the table, return the row of the table where each query n-gram is.
+    '''
+    tableKeys = get_row_keys(tableIds,vocabSize)
+    queryKeys = get_row_keys(queryIds,vocabSize)
+    return np.searchsorted(tableKeys,queryKeys)
+
+
+def get_context_groups(ngramIds):
+    '''
+    Given a sorted (M x n) table, return the row where each run of n-grams
+    with the same context (first n-1 words) starts, and for every row which
+    run it belongs to.
+    '''
+    isFirst = np.ones(len(ngramIds),dtype=bool)
+    if ngramIds.shape[1] > 1:
+        isFirst[1:] = (ngramIds[1:,:-1] != ngramIds[:-1,:-1]).any(axis=1)
+    else:
+        isFirst[1:] = False
+    return np.flatnonzero(isFirst), np.cumsum(isFirst)-1
+
+
+def get_unigram_counts(tables,startId=None):
+    '''
+    Return the unigram counts with a count of 0 for <s> (the word startId),
+    which starts every line but is never predicted, so that the unigram
+    probabilities add up to 1 over the words that are.
+    '''
+    uniIds, uniCounts = tables[0]
+    if startId is None:
+        return uniCounts
+    uniCounts = uniCounts.copy()
+    uniCounts[uniIds[:,0] == startId] = 0
+    return uniCounts
+
+
+def get_MLE_arrays(tables,vocabSize,startId=None):
+    '''
+    Compute the (logged) maximum likelihood estimates for every order of count
+    tables at once. The unigrams are divided by the number of tokens (not
+    counting <s>, see get_unigram_counts()), and every higher order n-gram by
+    the count of its n-1-gram history.
+    '''
+    uniCounts = get_unigram_counts(tables,startId)
+    with np.errstate(divide='ignore'):
+        MLEarrays = [np.log(uniCounts/uniCounts.sum())]
+    for n in range(2,len(tables)+1):
+        contextIds, contextCounts = tables[n-2]
+        ngramIds, ngramCounts = tables[n-1]
+        rows = find_rows(contextIds,ngramIds[:,:-1],vocabSize)
+        MLEarrays.append(np.log(ngramCounts/contextCounts[rows]))
+    return MLEarrays
+
+
+def table_to_dict(vocab,ngramIds,values):
+    '''
+    Compatibility view: turn a table of word IDs and a parallel array of
+    values into a dictionary keyed on tuples of words.
+    '''
+    return {tuple(vocab[i] for i in row): value
+            for row, value in zip(ngramIds.tolist(), values)}
+
+
+def dict_to_array(vocab,ngramIds,valueDict):
+    '''
+    The reverse of table_to_dict(): look up every n-gram of a table in a
+    dictionary keyed on tuples of words, and return the values as an array
+    parallel to the table.
+    '''
+    return np.array([valueDict[tuple(vocab[i] for i in row)]
+                     for row in ngramIds.tolist()])
@@ -0,0 +1,77 @@
+'''
+A persistent store of n-gram counts, so a model can be refreshed with new
+text without counting the whole corpus again.
+
+The store is one .npz file holding the integer count tables of
+corpus_stats.get_count_tables(): the sorted vocabulary (as UTF-8 bytes plus
+offsets) and, for every order, the sorted word IDs and counts. Updating it
+counts only the new text and merges those tables into the stored ones with
+corpus_stats.merge_count_tables().
+'''
+
+from corpus_stats import merge_count_tables, print_table_totals
+from instrument import log
+import numpy as np
+import os
+
+
+def save_count_store(storePath,vocab,tables):
+    '''
+    Write the vocabulary and count tables to storePath. The file is written
+    next to it first and then moved into place, so a crash never leaves a
+    half-written store behind.
+    '''
+    encoded = [word.encode('utf-8') for word in vocab]
+    vocabOffsets = np.zeros(len(vocab)+1,dtype=np.int64)
+    np.cumsum([len(word) for word in encoded],out=vocabOffsets[1:])
+    arrays = {'vocab_bytes': np.frombuffer(b''.join(encoded),dtype=np.uint8),
+              'vocab_offsets': vocabOffsets}
+    for n,(ngramIds,counts) in enumerate(tables,1):
+        arrays['ids_'+str(n)] = ngramIds
+        arrays['counts_'+str(n)] = counts
+    tmpPath = storePath + '.tmp'
+    with open(tmpPath,'wb') as storeFile:
+        np.savez(storeFile,**arrays)
+    os.replace(tmpPath,storePath)
+
+
+def load_count_store(storePath,order=None):
+    '''
+    Read back the vocabulary and count tables from a store, optionally only
+    up to the given order.
+    '''
+    with np.load(storePath) as store:
+        vocabBytes = store['vocab_bytes'].tobytes()
+        offsets = store['vocab_offsets']
+        vocab = [vocabBytes[start:end].decode('utf-8')
+                 for start,end in zip(offsets[:-1].tolist(),
+                                      offsets[1:].tolist())]
+        storedOrder = sum(1 for name in store.files
+                          if name.startswith('ids_'))
+        if order is None:
+            order = storedOrder
+        elif order > storedOrder:
+            raise ValueError(storePath+ ' only holds counts up to order ' +
+                             str(storedOrder))
+        tables = [(store['ids_'+str(n)],store['counts_'+str(n)])
+                  for n in range(1,order+1)]
+    return vocab, tables
+
+
+def update_count_store(storePath,vocab,tables,startTime):
+    '''
+    Merge newly counted tables into the store (creating it if there is none
+    yet), save it, and return the merged vocabulary and tables.
+    '''
+    if os.path.exists(storePath):
+        storedVocab, storedTables = load_count_store(storePath)
+        if len(storedTables) != len(tables):
+            raise ValueError(storePath+ ' holds counts up to order ' +
+                             str(len(storedTables))+ ', not ' +
+                             str(len(tables)))
+        vocab, tables = merge_count_tables([(storedVocab,storedTables),
+                                            (vocab,tables)])
+        log(startTime, 'merged the new counts into ' +storePath)
+        print_table_totals(tables,startTime)
+    save_count_store(storePath,vocab,tables)
+    return vocab, tables
@@ -1,8 +1,32 @@
+'''
+USAGE:$ python3 cutoff_words.py -i INFILE -a replace|delete [-k K | -n N]
+                                [-m MEMORY] [--metrics FILE [--trace-memory]]
+                                [--profile FILE]
+
+DESCRIPTION: Shrink the vocabulary of a cleaned corpus, either by cutting off
+the words which occur no more than K times, or by keeping only the N most
+frequent words. The cutoff words are replaced with <UNK> or deleted.
+
+The corpus is read twice, line by line: once to count the words, and once
+to map every token through a set lookup. With -m the counting spills to disk
+past the given memory (see external_counts.py).
+
+OUTPUT: cutoff-done-INFILE
+'''
+
 from collections import Counter
+from external_counts import (count_ngrams_external, merge_runs,
+                             parse_memory_size)
+from instrument import (log, stage, count, enable_metrics, write_metrics,
+                        profile_call, add_metrics_args)
+import tempfile
 import time
 import argparse
 import os
 
+# never cut these off, however rare or outside the top N
+SENTENCE_MARKERS = {'<s>','</s>'}
+
 def get_cutOff_words(tokens,k,startTime):
     '''
     Given a list of words from some cleaned file (i.e. all lowercase, with <s>
@@ -10,30 +34,62 @@ def get_cutOff_words(tokens,k,startTime):
     words which *did not* occur more than k times in the file.
     '''
     freqDict = Counter(tokens)
+    return select_cutOff_words(freqDict.items(),k,startTime)
+
+
+def select_cutOff_words(wordCounts,k,startTime):
+    '''
+    Given (word, count) pairs and a cutoff number, k, return a set of the
+    words which *did not* occur more than k times.
+    '''
     cutOffWords = set()
-    for key,value in freqDict.items():
-        if value <= k:
+    for key,value in wordCounts:
+        if value <= k and key not in SENTENCE_MARKERS:
             cutOffWords.add(key)
             
     numCutOffWords = len(cutOffWords)
-    print('[  '+ str("%.2f" % (time.time()-startTime)) +'  \t]'+
-          ' A total of '+ str(numCutOffWords) + ' words occurring less than '+
-          str(k)+ ' time(s) identified')
+    log(startTime, 'A total of '+ str(numCutOffWords) +
+        ' words occurring less than '+ str(k)+ ' time(s) identified')
     return cutOffWords
 
 
+def select_non_top_words(wordCounts,topN,startTime):
+    '''
+    Given (word, count) pairs, return a set of all the words which are not
+    among the topN most frequent ones (ties go to the word which sorts
+    first). The sentence markers are always kept, on top of the topN.
+    '''
+    ranked = sorted((pair for pair in wordCounts
+                     if pair[0] not in SENTENCE_MARKERS),
+                    key=lambda pair: (-pair[1],pair[0]))
+    cutOffWords = set(word for word,count in ranked[topN:])
+    log(startTime, 'A total of '+ str(len(cutOffWords)) +
+        ' words outside the top '+ str(topN)+ ' identified')
+    return cutOffWords
+
+
+def map_tokens(line, cutOffWords, replacement):
+    '''
+    Map every token of a line through the set of cutoff words: cutoff words
+    become replacement, or are dropped if replacement is None.
+    '''
+    if replacement is None:
+        return ' '.join([token for token in line.split()
+                         if token not in cutOffWords])
+    return ' '.join([replacement if token in cutOffWords else token
+                     for token in line.split()])
+
+
 def replace_cutoff_words_with_UNK(lines, cutOffWords, startTime):
     '''
     Given all the lines in a file represented as a character string, lines, and
     a set of all words which should be replaced in the text, replace all those
-    words in the character string, lines, with the string ' <UNK> '
-    NB - string.replace() is twice as fast as re.sub()!
+    words in the character string, lines, with the string '<UNK>'
     '''
-    for key in cutOffWords:
-        lines = lines.replace(' '+key+' ',' <UNK> ')
+    lines = '\n'.join([map_tokens(line, cutOffWords, '<UNK>')
+                       for line in lines.split('\n')])
             
-    print('[  '+ str("%.2f" % (time.time()-startTime)) +'  \t]'+
-          ' Cutoff Words replaced with <UNK> ')
+    log(startTime, 'Cutoff Words replaced with <UNK> ')
     return lines
 
 
@@ -42,56 +98,102 @@ def delete_cutoff_words(lines, cutOffWords, startTime):
     Given all the lines in a file represented as a character string, lines, and
     a set of all words which should be deleted in the text, delete all those
     words 
-    NB - string.replace() is twice as fast as re.sub()!
     '''
-    for key in cutOffWords:
-        lines = lines.replace(' '+key+' ',' ')
+    lines = '\n'.join([map_tokens(line, cutOffWords, None)
+                       for line in lines.split('\n')])
             
-    print('[  '+ str("%.2f" % (time.time()-startTime)) +'  \t]'+
-          ' Cutoff Words deleted ')
+    log(startTime, 'Cutoff Words deleted ')
     return lines
 
 
+def count_words_in_file(fileName, memoryBudget, startTime):
+    '''
+    First pass: stream the file and return its (word, count) pairs. Given a
+    memoryBudget (in bytes), the counts spill to disk past it.
+    '''
+    with open(fileName) as inFile:
+        if memoryBudget is None:
+            freqDict = Counter()
+            for line in inFile:
+                freqDict.update(line.split())
+            wordCounts = list(freqDict.items())
+        else:
+            with tempfile.TemporaryDirectory() as runDir:
+                runPaths = count_ngrams_external((line.split()
+                                                  for line in inFile),1,
+                                                 memoryBudget,runDir,startTime)
+                wordCounts = [(ngram[0],count)
+                              for ngram,count in merge_runs(runPaths[0])]
+    log(startTime, 'A total of '+
+        str(sum(count for word,count in wordCounts)) +
+        ' words in the input identified')
+    return wordCounts
+
+
+def map_file(fileName, outPath, cutOffWords, replacement, startTime):
+    '''
+    Second pass: stream the file and write every line with its tokens mapped
+    (see map_tokens()).
+    '''
+    with open(fileName) as inFile, \
+         open(outPath, 'w', encoding='utf-8') as outFile:
+        for line in inFile:
+            outFile.write(map_tokens(line, cutOffWords, replacement) + '\n')
+    log(startTime, 'Cutoff Words ' +('deleted' if replacement is None else
+                                     'replaced with ' +replacement))
+
+
 def parse_user_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('-i','--infile', type=str, help='the input text file')
-    parser.add_argument('-k','--cutoff', type=int, default=1,
+    cutoff = parser.add_mutually_exclusive_group()
+    cutoff.add_argument('-k','--cutoff', type=int, default=1,
                         help='frequency count cutoff')
+    cutoff.add_argument('-n','--top', type=int, default=None,
+                        help='keep only the N most frequent words')
     parser.add_argument('-a','--action', type=str, required = True,
                         choices=['replace', 'delete'],
                         help='action to perform on cutoff words')
+    parser.add_argument('-m','--memory', type=str, default=None,
+                        help='count within this much memory (e.g. 4G), '
+                        'spilling partial counts to temporary files')
+    add_metrics_args(parser)
     args = parser.parse_args()
     return args
 
-if __name__ == '__main__':
-    args = parse_user_args()
+def main(args,startTime):
     fileName = args.infile
     k = args.cutoff
     action = args.action
-    startTime = time.time()
-    
-    # open previously cleaned file
-    f = open(fileName)
-
-    lines = ''
-    for line in f:
-        lines += line
+    outPath = 'cutoff-done-' + os.path.basename(fileName)
+    memoryBudget = parse_memory_size(args.memory) if args.memory else None
 
-    tokens = [token for line in lines.split('\n')
-              for token in line.strip().split(' ')]
-    print('[  '+ str("%.2f" % (time.time()-startTime)) +'  \t]'+
-          ' A total of '+ str(len(tokens)) + ' words in the input identified')
+    # first pass: count the words
+    with stage('count'):
+        wordCounts = count_words_in_file(fileName, memoryBudget, startTime)
 
     # make the cutOff
-    cutOffWords = get_cutOff_words(tokens,k,startTime)
+    with stage('select'):
+        if args.top is not None:
+            cutOffWords = select_non_top_words(wordCounts, args.top, startTime)
+        else:
+            cutOffWords = select_cutOff_words(wordCounts, k, startTime)
+    count('words', len(wordCounts))
+    count('cutoff words', len(cutOffWords))
 
-    # do the action
+    # second pass: do the action
     if action == 'replace':
-        lines = replace_cutoff_words_with_UNK(lines,cutOffWords,startTime)
+        replacement = '<UNK>'
     elif action == 'delete':
-        lines = delete_cutoff_words(lines,cutOffWords,startTime)
+        replacement = None
+    with stage('map'):
+        map_file(fileName, outPath, cutOffWords, replacement, startTime)
 
-    outPath = 'cutoff-done-' + os.path.basename(fileName)
-    # print to a new file
-    with open(outPath, 'w', encoding='utf-8') as outFile:
-        outFile.write(lines)
+if __name__ == '__main__':
+    args = parse_user_args()
+    if args.metrics:
+        enable_metrics(args.trace_memory)
+    startTime = time.time()
+    profile_call(lambda: main(args,startTime), args.profile)
+    if args.metrics:
+        write_metrics(args.metrics)
@@ -0,0 +1,177 @@
+'''
+Bounded-memory n-gram counting for corpora which don't fit in RAM.
+
+n-grams are counted into dictionaries as usual, but whenever the dictionaries
+grow past a memory budget they are sorted and flushed to temporary run files
+on disk. Once the whole corpus has been read, the runs of every order are
+k-way merged, summing the counts of equal n-grams. Because the runs are
+sorted, the merged n-grams come out in the same order as the sorted
+vocabulary, so the count tables are built straight from the merge and are
+identical to the ones from corpus_stats.get_count_tables().
+'''
+
+from collections import Counter
+from array import array
+from corpus_stats import get_word_index, print_table_totals
+from instrument import log
+import numpy as np
+import operator
+import tempfile
+import heapq
+import sys
+import os
+
+# rough size of one dictionary entry (slot, tuple, int) for an n-gram,
+# not counting the word strings themselves, which are interned and shared
+BYTES_PER_ENTRY = 112
+BYTES_PER_WORD = 8
+# never have more run files than this open at once while merging
+MAX_OPEN_RUNS = 64
+
+
+def parse_memory_size(size):
+    '''
+    Turn a human readable memory size such as '4G', '512M' or '100k' into a
+    number of bytes.
+    '''
+    units = {'k':2**10, 'm':2**20, 'g':2**30, 't':2**40}
+    size = size.strip().lower().rstrip('b')
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def estimate_bytes(countDicts):
+    return sum(len(countDict) * (BYTES_PER_ENTRY + BYTES_PER_WORD*n)
+               for n,countDict in enumerate(countDicts,1))
+
+
+def write_run(sortedCounts,runPath):
+    '''
+    Write sorted (n-gram, count) pairs to a run file, one n-gram per line as:
+    w1 w2 ... wn<TAB>count
+    '''
+    with open(runPath,'w',encoding='utf-8') as runFile:
+        for ngram,count in sortedCounts:
+            runFile.write(' '.join(ngram) +'\t'+ str(count) +'\n')
+
+
+def read_run(runPath):
+    with open(runPath,encoding='utf-8') as runFile:
+        for line in runFile:
+            ngram, count = line.rstrip('\n').rsplit('\t',1)
+            yield tuple(ngram.split(' ')), int(count)
+
+
+def merge_runs(runPaths):
+    '''
+    k-way merge a list of sorted run files, yielding every distinct n-gram
+    (in sorted order) together with its total count.
+    '''
+    merged = heapq.merge(*[read_run(runPath) for runPath in runPaths],
+                         key=operator.itemgetter(0))
+    lastNgram = None
+    total = 0
+    for ngram,count in merged:
+        if ngram == lastNgram:
+            total += count
+        else:
+            if lastNgram is not None:
+                yield lastNgram, total
+            lastNgram = ngram
+            total = count
+    if lastNgram is not None:
+        yield lastNgram, total
+
+
+def reduce_runs(runPaths,tmpDir):
+    '''
+    If there are too many runs to open at once, merge them in batches into
+    bigger runs until there are few enough.
+    '''
+    while len(runPaths) > MAX_OPEN_RUNS:
+        mergedPaths = []
+        for i in range(0,len(runPaths),MAX_OPEN_RUNS):
+            batch = runPaths[i:i+MAX_OPEN_RUNS]
+            fd, mergedPath = tempfile.mkstemp(suffix='.run',dir=tmpDir)
+            os.close(fd)
+            write_run(merge_runs(batch),mergedPath)
+            for runPath in batch:
+                os.remove(runPath)
+            mergedPaths.append(mergedPath)
+        runPaths = mergedPaths
+    return runPaths
+
+
+def count_ngrams_external(sentences,order,memoryBudget,tmpDir,startTime):
+    '''
+    Count all n-grams of order 1..order in an iterable of token lists,
+    spilling sorted partial counts to run files in tmpDir whenever the
+    estimated size of the counts goes over memoryBudget (in bytes). Returns a
+    list of lists of run files, runPaths[n-1] holding the runs of the n-grams.
+    '''
+    countDicts = [Counter() for n in range(order)]
+    runPaths = [[] for n in range(order)]
+
+    def flush():
+        for n,countDict in enumerate(countDicts,1):
+            if countDict:
+                fd, runPath = tempfile.mkstemp(suffix='.run',dir=tmpDir)
+                os.close(fd)
+                write_run(sorted(countDict.items()),runPath)
+                runPaths[n-1].append(runPath)
+                countDict.clear()
+        log(startTime, 'flushed run ' +str(len(runPaths[0]))+ ' to disk')
+
+    for tokens in sentences:
+        tokens = [sys.intern(token) for token in tokens]
+        for n in range(1,order+1):
+            countDicts[n-1].update(zip(*[tokens[i:] for i in range(n)]))
+        if estimate_bytes(countDicts) > memoryBudget:
+            flush()
+    if any(countDicts):
+        flush()
+    return [reduce_runs(paths,tmpDir) for paths in runPaths]
+
+
+def read_sentences(fileName,lenSentenceCutoff):
+    '''
+    Yield the token lists of the lines of a cleaned file which are longer
+    than lenSentenceCutoff, split the same way ngrams.py splits them.
+    '''
+    with open(fileName) as inFile:
+        for line in inFile:
+            tokens = line.rstrip('\n').split(' ')
+            if len(tokens) > lenSentenceCutoff:
+                yield tokens
+
+
+def get_count_tables_external(fileName,order,startTime,lenSentenceCutoff,
+                              memoryBudget,tmpDir=None):
+    '''
+    Same as corpus_stats.get_count_tables(), but the counting never holds more
+    than about memoryBudget bytes of n-gram counts in memory. Only the
+    final tables (word IDs and counts, no strings) are held in RAM.
+    '''
+    with tempfile.TemporaryDirectory(dir=tmpDir) as runDir:
+        runPaths = count_ngrams_external(read_sentences(fileName,
+                                                        lenSentenceCutoff),
+                                         order,memoryBudget,runDir,startTime)
+        vocab = []
+        uniCounts = array('q')
+        for ngram,count in merge_runs(runPaths[0]):
+            vocab.append(ngram[0])
+            uniCounts.append(count)
+        wordIndex = get_word_index(vocab)
+        tables = [(np.arange(len(vocab),dtype=np.int32).reshape(-1,1),
+                   np.frombuffer(uniCounts,dtype=np.int64))]
+        for n in range(2,order+1):
+            ids = array('i')
+            counts = array('q')
+            for ngram,count in merge_runs(runPaths[n-1]):
+                ids.extend([wordIndex[word] for word in ngram])
+                counts.append(count)
+            tables.append((np.frombuffer(ids,dtype=np.int32).reshape(-1,n),
+                           np.frombuffer(counts,dtype=np.int64)))
+    print_table_totals(tables,startTime)
+    return vocab, tables
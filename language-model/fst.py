@@ -0,0 +1,194 @@
+'''
+Writing n-gram models as grammar FSTs (G) in OpenFst text format, the way
+Kaldi's arpa2fst builds them, straight from the count tables of ngrams.py
+instead of going through an ARPA file.
+
+Every n-gram of order below the highest one which doesn't end in </s> is a
+state (its history), with the empty history as state 0 and <s> as the start
+state. An n-gram w1..wn is an arc w:w from the state of w1..wn-1 to the
+state of w1..wn, or for the highest order to the state of w2..wn, weighted by
+its negated natural log probability. </s> is the final weight of a state
+instead of an arc. Every state backs off to the state of its history minus
+its first word with a #0:<eps> arc weighted by the negated backoff weight.
+
+Like arpa.py the arcs are written order by order in chunks, with the states
+of a whole chunk looked up at once by binary search. Compile with
+
+    fstcompile --isymbols=G.words.txt --osymbols=G.words.txt G.fst.txt G.fst
+'''
+
+from corpus_stats import get_row_keys
+from arpa import open_lm_file, CHUNK_SIZE, LOG10E, LOG_ZERO
+from instrument import log
+import numpy as np
+
+FST_EXT = '.fst.txt'
+EPSILON = '<eps>'
+BACKOFF_SYMBOL = '#0'
+SENTENCE_START = '<s>'
+SENTENCE_END = '</s>'
+# backoff weights are clipped the way ARPA files clip them
+MIN_LOG_BOW = LOG_ZERO / LOG10E
+
+
+def get_word_symbols(vocab):
+    '''
+    Return the words of a symbol table in Kaldi's order: <eps>, the sorted
+    words, #0, <s> and </s>.
+    '''
+    markers = {SENTENCE_START,SENTENCE_END}
+    words = sorted(word for word in vocab if word not in markers)
+    return [EPSILON] + words + [BACKOFF_SYMBOL,SENTENCE_START,SENTENCE_END]
+
+
+def is_fst_path(path):
+    return path.endswith(FST_EXT) or path.endswith(FST_EXT + '.gz')
+
+
+def write_symbol_table(path,symbols):
+    with open(path,'w',encoding='utf-8') as outFile:
+        outFile.writelines('%s %d\n' % (symbol,i)
+                           for i,symbol in enumerate(symbols))
+
+
+def get_symbol_table_path(fstPath):
+    '''
+    G.fst.txt (or G.fst.txt.gz) goes with G.words.txt.
+    '''
+    if fstPath.endswith('.gz'):
+        fstPath = fstPath[:-len('.gz')]
+    if fstPath.endswith(FST_EXT):
+        return fstPath[:-len(FST_EXT)] + '.words.txt'
+    return fstPath + '.words.txt'
+
+
+def get_state_ids(vocab,tables):
+    '''
+    Number the states: 0 for the empty history, then every n-gram of order
+    1..N-1 not ending in </s>, order by order. Returns one array per order
+    below the highest with the state of each n-gram (-1 for none).
+    '''
+    endId = vocab.index(SENTENCE_END) if SENTENCE_END in vocab else -1
+    stateIds = []
+    nextState = 1
+    for ngramIds,counts in tables[:-1]:
+        isState = ngramIds[:,-1] != endId
+        ids = np.full(len(ngramIds), -1, dtype=np.int64)
+        ids[isState] = np.arange(nextState, nextState+isState.sum())
+        nextState += isState.sum()
+        stateIds.append(ids)
+    return stateIds
+
+
+def lookup_states(stateIds,tableKeys,queryIds,vocabSize):
+    '''
+    Return the states of n-grams which are all in a sorted table.
+    '''
+    return stateIds[np.searchsorted(tableKeys,get_row_keys(queryIds,
+                                                           vocabSize))]
+
+
+def format_arcs(sources,dests,words,weights,precision):
+    template = '%d\t%d\t%s\t%s\t%.' +str(precision)+ 'f\n'
+    return ''.join([template % (source,dest,word,word,weight)
+                    for source,dest,word,weight in
+                    zip(sources.tolist(),dests.tolist(),words,
+                        weights.tolist())])
+
+
+def format_finals(states,weights,precision):
+    template = '%d\t%.' +str(precision)+ 'f\n'
+    return ''.join([template % line for line in zip(states.tolist(),
+                                                    weights.tolist())])
+
+
+def format_backoffs(sources,dests,weights,precision):
+    template = '%d\t%d\t' +BACKOFF_SYMBOL+ '\t' +EPSILON+ '\t%.' + \
+        str(precision)+ 'f\n'
+    return ''.join([template % line for line in zip(sources.tolist(),
+                                                    dests.tolist(),
+                                                    weights.tolist())])
+
+
+def write_fst(outPath,vocab,tables,logProbs,logBows,startTime,precision=6):
+    '''
+    Write a model as an OpenFst text grammar, and its symbol table next to
+    it (see get_symbol_table_path()). Takes what arpa.write_arpa() takes:
+        (1) the path to write to, gzipped if it ends in .gz
+        (2) the sorted vocabulary (vocab[ID] = word)
+        (3) the list of (ngramIds, counts) tables, tables[n-1] for order n
+        (4) the (natural log) probability of every n-gram, one array per order
+        (5) the (natural log) backoff weight of every n-gram, one array per
+            order except the highest, or None for no backoff weights
+    n-grams with a probability of zero get no arc.
+    '''
+    vocabArray = np.array(vocab,dtype=object)
+    vocabSize = len(vocab)
+    order = len(tables)
+    startId = vocab.index(SENTENCE_START) if SENTENCE_START in vocab else -1
+    endId = vocab.index(SENTENCE_END) if SENTENCE_END in vocab else -1
+    stateIds = get_state_ids(vocab,tables)
+    tableKeys = [get_row_keys(ngramIds,vocabSize)
+                 for ngramIds,counts in tables[:-1]]
+
+    with open_lm_file(outPath,'wt') as outFile:
+        # the source of the first arc is the start state: <s> if it has one
+        startRow = None
+        if order > 1 and startId >= 0:
+            startRow = np.searchsorted(tableKeys[0],startId)
+            startBow = 0. if logBows is None else \
+                max(logBows[0][startRow],MIN_LOG_BOW)
+            outFile.write(format_backoffs(stateIds[0][[startRow]],
+                                          np.zeros(1,dtype=np.int64),
+                                          np.array([-startBow]),precision))
+
+        for n,(ngramIds,counts) in enumerate(tables,1):
+            for start in range(0,len(ngramIds),CHUNK_SIZE):
+                end = start + CHUNK_SIZE
+                chunkIds = ngramIds[start:end]
+                weights = -logProbs[n-1][start:end]
+                if n == 1:
+                    sources = np.zeros(len(chunkIds),dtype=np.int64)
+                else:
+                    sources = lookup_states(stateIds[n-2],tableKeys[n-2],
+                                            chunkIds[:,:-1],vocabSize)
+                lastIds = chunkIds[:,-1]
+                usable = np.isfinite(weights) & (lastIds != startId)
+                isFinal = usable & (lastIds == endId)
+                isArc = usable & (lastIds != endId)
+                if n < order:
+                    dests = stateIds[n-1][start:end][isArc]
+                elif n > 1:
+                    dests = lookup_states(stateIds[n-2],tableKeys[n-2],
+                                          chunkIds[isArc,1:],vocabSize)
+                else:
+                    dests = np.zeros(isArc.sum(),dtype=np.int64)
+                outFile.write(format_arcs(sources[isArc],dests,
+                                          vocabArray[lastIds[isArc]],
+                                          weights[isArc],precision))
+                outFile.write(format_finals(sources[isFinal],weights[isFinal],
+                                            precision))
+
+                if n == order:
+                    continue
+                # backoff arcs of the states of this chunk
+                isState = stateIds[n-1][start:end] >= 0
+                if startRow is not None and n == 1 and \
+                    start <= startRow < end:
+                    # already written as the first line
+                    isState[startRow-start] = False
+                if n == 1:
+                    backoffDests = np.zeros(isState.sum(),dtype=np.int64)
+                else:
+                    backoffDests = lookup_states(stateIds[n-2],tableKeys[n-2],
+                                                 chunkIds[isState,1:],
+                                                 vocabSize)
+                if logBows is None:
+                    bows = np.zeros(isState.sum())
+                else:
+                    bows = logBows[n-1][start:end][isState]
+                bows = np.maximum(bows,MIN_LOG_BOW)
+                outFile.write(format_backoffs(stateIds[n-1][start:end][isState],
+                                              backoffDests,-bows,precision))
+    write_symbol_table(get_symbol_table_path(outPath),get_word_symbols(vocab))
+    log(startTime, 'successfully printed grammar FST to ' +outPath)
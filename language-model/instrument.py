@@ -0,0 +1,135 @@
+'''
+Progress messages, stage timers, counters and memory peaks shared by the
+language model scripts.
+
+log() prints the usual "[  seconds  ]  message" progress line. Everything
+else is off until enable_metrics() is called (the scripts do so for
+--metrics FILE). Until then stage() hands back one shared do-nothing context
+manager, and count() returns right away. Once metrics are on, every stage
+records its wall time and every counter its total. With traceMemory, each
+stage also records its tracemalloc peak (NumPy reports its arrays to
+tracemalloc) and the process's peak RSS. write_metrics() saves all of it,
+together with the logged messages, as JSON. profile_call() runs a function
+under cProfile when given a path for the stats.
+'''
+
+from contextlib import contextmanager, nullcontext
+import tracemalloc
+import cProfile
+import json
+import time
+import sys
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# None while metrics are off
+metrics = None
+NO_STAGE = nullcontext()
+
+
+def log(startTime,message):
+    '''
+    Print message after the seconds since startTime.
+    '''
+    print('[  '+ str("%.2f" % (time.time()-startTime)) +'  \t] '+ message)
+    if metrics is not None:
+        metrics['log'].append({'time_s': round(time.time()-startTime,4),
+                               'message': message})
+
+
+def enable_metrics(traceMemory=False):
+    global metrics
+    metrics = {'argv': sys.argv,
+               'start': time.time(),
+               'trace_memory': traceMemory,
+               'stages': [],
+               'counters': {},
+               'log': []}
+    if traceMemory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def get_peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peakRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peakRss / (2**20 if sys.platform == 'darwin' else 2**10), 1)
+
+
+@contextmanager
+def timed_stage(name):
+    record = {'name': name,
+              'start_s': round(time.time()-metrics['start'],4)}
+    if metrics['trace_memory']:
+        tracemalloc.reset_peak()
+    startTime = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['wall_s'] = round(time.perf_counter()-startTime,4)
+        if metrics['trace_memory']:
+            record['tracemalloc_peak_mb'] = \
+                round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+            record['rss_peak_mb'] = get_peak_rss_mb()
+        metrics['stages'].append(record)
+
+
+def stage(name):
+    '''
+    Time the body of a with statement as the stage name. Stages are not meant
+    to be nested.
+    '''
+    if metrics is None:
+        return NO_STAGE
+    return timed_stage(name)
+
+
+def count(name,n=1):
+    '''
+    Add n to the counter name.
+    '''
+    if metrics is None:
+        return
+    metrics['counters'][name] = metrics['counters'].get(name,0) + int(n)
+
+
+def write_metrics(path):
+    report = {'argv': metrics['argv'],
+              'total_s': round(time.time()-metrics['start'],4),
+              'stages': metrics['stages'],
+              'counters': metrics['counters'],
+              'peak_rss_mb': get_peak_rss_mb(),
+              'log': metrics['log']}
+    with open(path, 'w', encoding='utf-8') as outFile:
+        json.dump(report, outFile, indent=2, ensure_ascii=False)
+        outFile.write('\n')
+
+
+def profile_call(function,profilePath=None):
+    '''
+    Call function, under cProfile if given a path to dump the stats to (read
+    them with python3 -m pstats PATH).
+    '''
+    if profilePath is None:
+        return function()
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function)
+    finally:
+        profiler.dump_stats(profilePath)
+
+
+def add_metrics_args(parser):
+    parser.add_argument('--metrics', type=str, default=None,
+                        help='write stage timings and counters to this JSON '
+                        'file')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='with --metrics, also record the memory peak of '
+                        'every stage (slower)')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='run under cProfile and dump the stats to this '
+                        'file')
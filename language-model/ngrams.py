@@ -1,10 +1,27 @@
 '''
 Author: Joshua Meyer
 
-USAGE:$ python3 ngrams.py -i INFILE -s SMOOTHING -b BACKOFF
+USAGE:$ python3 ngrams.py -i INFILE -o OUTFILE -n ORDER [-j JOBS | -m MEMORY]
+                          -s SMOOTHING -b BACKOFF [--store COUNTS [--update]]
+                          [--metrics FILE [--trace-memory]] [--profile FILE]
 
 DESCRIPTION: Given a cleaned corpus (text file), output a model of n-grams 
-in ARPA format
+in ARPA format. The corpus is streamed line by line into integer word IDs,
+and the n-grams of every order 1..ORDER are counted with vectorized sorts over
+NumPy arrays, so no list of n-gram tuples is ever built. If OUTFILE ends in
+.gz the model is written gzipped, if it ends in .bin it is written in the
+memory-mapped format of binary_lm.py, and if it ends in .fst.txt it is
+written as an OpenFst text grammar (G) with a symbol table, see fst.py.
+
+With --store the raw counts are saved to a file. A later run with
+-i NEWTEXT --store COUNTS --update only counts NEWTEXT, adds it to the saved
+counts and builds the model from the total; --store COUNTS without -i builds
+the model from the saved counts alone.
+
+--metrics FILE writes the time taken by every stage (counting, smoothing,
+backoff, pruning, writing) and the n-gram counts to FILE as JSON,
+--trace-memory adds the memory peak of every stage, and --profile FILE runs
+the whole build under cProfile.
 
 
 #####################
@@ -33,157 +50,208 @@ SOFTWARE.
 '''
 
 from corpus_stats import *
-from backoff import get_brants_bow_dict
+from smoothing import (get_modified_kneser_ney_arrays, get_smoothed_arrays,
+                       get_witten_bell_arrays)
+from external_counts import get_count_tables_external, parse_memory_size
+from backoff import (get_brants_bow_array, get_katz_prob_arrays,
+                     get_katz_bow_arrays)
+from prune import get_cutoff_keeps, select_rows, prune_by_entropy
+from count_store import save_count_store, load_count_store, update_count_store
+from arpa import write_arpa
+from binary_lm import write_binary_lm_from_tables
+from fst import write_fst, is_fst_path
+from instrument import (log, stage, count, enable_metrics, write_metrics,
+                        profile_call, add_metrics_args)
 import argparse
-import operator
 import numpy as np
-from collections import Counter
-import re
 import time
 import sys
 
 def parse_user_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('-i','--infile', type=str, help='the input text file')
+    parser.add_argument('-o','--outfile', type=str, default=None,
+                        help='where to write the ARPA model (.gz to gzip it, '
+                        '.bin for binary, .fst.txt for a grammar FST), '
+                        'by default lm_smoothing-S_backoff-B.txt')
+    parser.add_argument('-n','--order', type=int, default=3,
+                        help='highest n-gram order in the model')
+    parser.add_argument('-j','--jobs', type=int, default=1,
+                        help='number of processes to count n-grams with')
+    parser.add_argument('-m','--memory', type=str, default=None,
+                        help='count within this much memory (e.g. 4G), '
+                        'spilling partial counts to temporary files')
     parser.add_argument('-s','--smoothing',type=str, help='flavor of smoothing',
-                        choices = ['none','laplace','turing'], default='none')
-    parser.add_argument('-bo','--backoff', action='store_true',
-                        help='add backoff weights')
+                        choices = ['none','laplace','turing','witten-bell',
+                                   'kneser-ney'],
+                        default='none')
+    parser.add_argument('-bo','--backoff', type=str, nargs='?',
+                        choices=['none','brants','katz'], default='none',
+                        const='brants',
+                        help='add backoff weights (-bo alone means brants);'
+                        ' kneser-ney and witten-bell come with their own')
+    parser.add_argument('--store', type=str, default=None,
+                        help='save the counts to this file; without -i, build'
+                        ' the model from the counts saved in it')
+    parser.add_argument('--update', action='store_true',
+                        help='add the counts of the input to the ones in'
+                        ' --store instead of replacing them')
+    parser.add_argument('-c','--cutoffs', type=int, nargs='+', default=None,
+                        help='drop n-grams seen no more than this many times,'
+                        ' one cutoff per order starting with the unigrams'
+                        ' (which must be 0), e.g. -c 0 1 1')
+    parser.add_argument('-pt','--prune-threshold', type=float, default=None,
+                        help='drop n-grams whose relative entropy pruning'
+                        ' delta is under this threshold (in nats)')
+    parser.add_argument('-ps','--prune-size', type=int, default=None,
+                        help='entropy prune the model down to about this many'
+                        ' n-grams')
+    add_metrics_args(parser)
     args = parser.parse_args()
-    return args
-
-
-def get_ngram_tuples(lines,startTime,lenSentenceCutoff):
-    unigrams=[]
-    bigrams=[]
-    trigrams=[]
-    for line in lines.split('\n'):
-        line = line.split(' ')
-        if len(line) >lenSentenceCutoff:
-            unigrams+=get_ngrams_from_line(line,1)
-            bigrams+=get_ngrams_from_line(line,2)
-            trigrams+=get_ngrams_from_line(line,3)
-    print('[  '+ str("%.2f" % (time.time()-startTime)) +'  \t]'+
-          ' A total of ' +str(len(unigrams))+
-          ' unigrams found')
-    print('[  '+ str("%.2f" % (time.time()-startTime)) +'  \t]'+ ' A total of '+
-          str(len(bigrams)) + ' bigrams found')
-    print('[  '+ str("%.2f" % (time.time()-startTime)) +'  \t]'+ ' A total of '+
-          str(len(trigrams)) + ' trigrams found')
-    return unigrams, bigrams, trigrams
-
-
-def get_ngrams_from_line(tokens, n):
-    '''
-    Given a list of tokens, return a list of tuple ngrams
-    '''
-    ngrams=[]
-    # special case for unigrams
-    if n==1:
-        for token in tokens:
-            # we need parentheses and a comma to make a tuple
-            ngrams.append((token,))
-    # general n-gram case
-    else:
-        for i in range(len(tokens)-(n-1)):
-            ngrams.append(tuple(tokens[i:i+n]))
-    return ngrams
+    if args.infile is None and args.store is None:
+        parser.error('give an input file (-i), a count store (--store) or both')
+    if args.update and (args.infile is None or args.store is None):
+        parser.error('--update needs both -i and --store')
+    pruning = args.prune_threshold is not None or args.prune_size is not None
+    if pruning and args.smoothing not in ('kneser-ney','witten-bell') and \
+        args.backoff != 'katz':
+        parser.error('entropy pruning needs a normalized backoff model: '
+                     '-s kneser-ney, -s witten-bell or -bo katz')
+    return parser, args
+
+
+def build_model(args,parser,startTime):
+    fileName = args.infile
+    smoothing = args.smoothing
+    backoff = args.backoff
+    order = args.order
+
+    # count all the ngrams up to the given order as integer-encoded tables
+    with stage('count'):
+        if fileName is None:
+            try:
+                vocab, tables = load_count_store(args.store,order)
+            except (OSError, ValueError) as error:
+                parser.error(str(error))
+            log(startTime, 'loaded counts from ' +args.store)
+        elif args.memory:
+            vocab, tables = get_count_tables_external(
+                fileName,order,startTime,lenSentenceCutoff=4,
+                memoryBudget=parse_memory_size(args.memory))
+        elif args.jobs > 1:
+            vocab, tables = get_count_tables_parallel(fileName,order,startTime,
+                                                      lenSentenceCutoff=4,
+                                                      jobs=args.jobs)
+        else:
+            vocab, tables = get_count_tables(fileName,order,startTime,
+                                             lenSentenceCutoff=4)
+
+    # keep the raw counts around, so the next run only has to count new text
+    if fileName is not None and args.store:
+        with stage('store'):
+            if args.update:
+                try:
+                    vocab, tables = update_count_store(args.store,vocab,
+                                                       tables,startTime)
+                except (OSError, ValueError) as error:
+                    parser.error(str(error))
+            else:
+                save_count_store(args.store,vocab,tables)
+
+    # <s> is only ever a context, so it takes no unigram probability mass
+    startId = vocab.index('<s>') if '<s>' in vocab else None
+
+    count('words', len(vocab))
+    for n,(ngramIds,counts) in enumerate(tables,1):
+        count(str(n)+ '-grams', counts.sum())
+        count('distinct ' +str(n)+ '-grams', len(counts))
 
+    keeps = None
+    if args.cutoffs:
+        with stage('cutoffs'):
+            keeps = get_cutoff_keeps(tables,args.cutoffs,len(vocab),startTime)
+            if smoothing != 'kneser-ney':
+                tables = select_rows(tables,keeps)
 
-def print_to_file(uniBowDict,biBowDict,triMLEdict,
-                  backoff,smoothing,startTime):
-    if backoff:
-        backedOff = 'yes'
+    if smoothing == 'kneser-ney':
+        # interpolated modified Kneser-Ney comes with its own backoff weights,
+        # and takes its continuation counts from the tables before cutoffs
+        backoff = 'kneser-ney'
+        with stage('smoothing'):
+            logProbs, logBows = get_modified_kneser_ney_arrays(tables,
+                                                               len(vocab),
+                                                               startTime,
+                                                               keeps)
+            if keeps is not None:
+                tables = select_rows(tables,keeps)
+    elif smoothing == 'witten-bell':
+        # so does interpolated Witten-Bell: its interpolation weights
+        backoff = 'witten-bell'
+        with stage('smoothing'):
+            logProbs, logBows = get_witten_bell_arrays(tables,len(vocab),
+                                                       startTime,startId)
     else:
-        backedOff = 'no'
-        
-    with open(('lm_smoothing-' + smoothing +
-               '_backoff-' + backedOff +
-               '.txt'),
-              'w', encoding = 'utf-8') as outFile:
-        # Print ARPA preamble
-        outFile.write('\n\data\\\n')
-        outFile.write('ngram 1=' + str(len(uniBowDict)) +'\n')
-        outFile.write('ngram 2=' + str(len(biBowDict)) +'\n')
-        outFile.write('ngram 3=' + str(len(triMLEdict)) +'\n')
-
-        ## print unigrams
-        outFile.write('\n\\1-grams:\n')
-        sortedUni = sorted(uniBowDict.items(), key=operator.itemgetter(1),
-                          reverse=True)
-        for key,value in sortedUni:
-            if backoff:
-                entry = (str(value[0]) +' '+ key[0] +' '+
-                         str(value[1]))
+        with stage('smoothing'):
+            if smoothing == 'none':
+                # get probabilities (maximum likelihood) for every order at
+                # once: unigram counts divided by number of unigrams, and the
+                # conditional probabilities for all ngrams that are not
+                # unigrams
+                logProbs = get_MLE_arrays(tables,len(vocab),startId)
             else:
-                entry = (str(value[0]) +' '+ key[0])
-            outFile.write(entry+'\n')
-            
-        ## print bigrams
-        outFile.write('\n\\2-grams:\n')
-        sortedBi = sorted(biBowDict.items(), key=operator.itemgetter(1),
-                           reverse=True)
-        for key,value in sortedBi:
-            if backoff:
-                entry = (str(value[0]) +' '+ key[0] +' '+ key[1] +' '+
-                         str(value[1]))
+                # smooth each order as a whole from its counts-of-counts
+                logProbs = get_smoothed_arrays(tables,len(vocab),smoothing,
+                                               startTime)
+
+        with stage('backoff'):
+            if backoff == 'katz':
+                if smoothing == 'none':
+                    # Katz backoff needs discounted probabilities, so fall
+                    # back on its own Good-Turing discounts
+                    logProbs = get_katz_prob_arrays(tables,len(vocab),
+                                                    startId=startId)
+                logBows = get_katz_bow_arrays(tables,logProbs,len(vocab))
+            elif backoff == 'brants':
+                # get backoff weighting for every order except the highest one
+                logBows = [get_brants_bow_array(logProb)
+                           for logProb in logProbs[:-1]]
             else:
-                entry = (str(value[0]) +' '+ key[0] +' '+ key[1])
-            outFile.write(entry+'\n')
+                logBows = None
+
+    if args.prune_threshold is not None or args.prune_size is not None:
+        # backoff weights are recomputed (normalized) over what is left
+        with stage('prune'):
+            tables, logProbs, logBows = prune_by_entropy(
+                tables,logProbs,len(vocab),startTime,
+                threshold=args.prune_threshold,targetSize=args.prune_size,
+                startId=startId)
 
-        ## print trigrams
-        outFile.write('\n\\3-grams:\n')
-        sortedTri = sorted(triMLEdict.items(), key=operator.itemgetter(1),
-                           reverse=True)
-        for key,value in sortedTri:
-            entry = (str(value) +' '+ key[0] +' '+ key[1] +' '+ key[2])
-            outFile.write(entry+'\n')
-        outFile.write('\n\end\\')
-    print('[  '+ str("%.2f" % (time.time()-startTime)) +'  \t]'+
-          ' successfully printed model to file!')
+    outPath = args.outfile
+    if outPath is None:
+        backedOff = backoff if backoff != 'none' else 'no'
+        outPath = 'lm_smoothing-' +smoothing+ '_backoff-' +backedOff+ '.txt'
+    with stage('write'):
+        if outPath.endswith('.bin'):
+            write_binary_lm_from_tables(outPath,vocab,tables,logProbs,logBows)
+            log(startTime, 'successfully wrote binary model to ' +outPath)
+        elif is_fst_path(outPath):
+            write_fst(outPath,vocab,tables,logProbs,logBows,startTime)
+        else:
+            write_arpa(outPath,vocab,tables,logProbs,logBows,startTime)
 
 
 def main():
     # get user input
-    args = parse_user_args()
-    fileName = args.infile
-    smoothing = args.smoothing
-    backoff = args.backoff
-    
+    parser, args = parse_user_args()
+    if args.metrics:
+        enable_metrics(args.trace_memory)
+
     startTime = time.time()
-    print('[  '+ str("%.2f" % (time.time()-startTime)) +'  \t]'+ ' running')
-
-    # open previously cleaned file
-    f = open(fileName)
-    lines = ''
-    for line in f:
-        lines += line
-        
-    # get lists of tuples of ngrams
-    unigrams, bigrams, trigrams = get_ngram_tuples(lines,startTime,
-                                                   lenSentenceCutoff=4)
-
-    # get raw count dictionaries
-    uniCountDict = get_count_dict(unigrams)
-    biCountDict = get_count_dict(bigrams)
-    triCountDict = get_count_dict(trigrams)
-
-    # divide unigram counts by number of unigrams to get probability
-    N = sum(uniCountDict.values())
-    uniProbDict = {}
-    for key,value in uniCountDict.items():
-        uniProbDict[key] = np.log(value/N)
-
-    # get conditional probabilities (maximum likelihood) for all ngrams that 
-    # are not unigrams
-    biMLEdict = get_MLE_dict(uniCountDict,biCountDict,2)
-    triMLEdict = get_MLE_dict(biCountDict,triCountDict,3)
-
-    # get backoff weighting
-    uniBowDict = get_brants_bow_dict(uniProbDict)
-    biBowDict = get_brants_bow_dict(biMLEdict)
-    
-    print_to_file(uniBowDict,biBowDict,triMLEdict,backoff,smoothing,startTime)
+    log(startTime, 'running')
+    profile_call(lambda: build_model(args,parser,startTime), args.profile)
+
+    if args.metrics:
+        write_metrics(args.metrics)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,188 @@
+'''
+Pruning for the n-gram models built by ngrams.py.
+
+Two stages, both on the integer count tables from corpus_stats:
+
+  (1) count cutoffs, before any probabilities are computed: n-grams seen no
+      more than k times (k given per order) are dropped.
+
+  (2) relative entropy pruning (Stolcke 1998), once the model is built: every
+      n-gram of order 2 and up is scored by how much the model would change
+      (in relative entropy, in nats) if it were dropped and its probability
+      backed off instead, and the ones that matter least are dropped, either
+      all under a threshold or as many as needed to get to a target size.
+
+The tables are kept consistent as ARPA requires: an n-gram is only kept if
+its history and its lower order suffix are kept too. After pruning, the
+backoff weights are recomputed over the n-grams which are left.
+'''
+
+from corpus_stats import find_rows, get_context_groups, get_row_keys
+from backoff import get_katz_bow_arrays, MIN_MASS
+from instrument import log
+import numpy as np
+
+
+def get_kept_rows(tables,n,keep,vocabSize):
+    '''
+    Given a mask of the n-grams of the n-1 order table to keep, return the
+    mask of the n-grams of order n whose history and suffix are both kept.
+    '''
+    ngramIds = tables[n-1][0]
+    lowerKeys = get_row_keys(tables[n-2][0][keep],vocabSize)
+    return (np.isin(get_row_keys(ngramIds[:,:-1],vocabSize),lowerKeys) &
+            np.isin(get_row_keys(ngramIds[:,1:],vocabSize),lowerKeys))
+
+
+def get_cutoff_keeps(tables,cutoffs,vocabSize,startTime):
+    '''
+    Return the masks of the n-grams to keep, per order: the n-grams of order
+    n seen more than cutoffs[n-1] times whose history and suffix are kept
+    too. If there are fewer cutoffs than orders the last one is used for the
+    rest. The unigrams are the vocabulary, so their cutoff has to be 0.
+    '''
+    if cutoffs[0] != 0:
+        raise ValueError('the unigram cutoff has to be 0, use cutoff_words.py'
+                         ' to shrink the vocabulary')
+    cutoffs = list(cutoffs) + [cutoffs[-1]]*(len(tables)-len(cutoffs))
+    keeps = [np.ones(len(tables[0][1]),dtype=bool)]
+    for n in range(2,len(tables)+1):
+        counts = tables[n-1][1]
+        keep = (counts > cutoffs[n-1]) & get_kept_rows(tables,n,keeps[-1],
+                                                       vocabSize)
+        keeps.append(keep)
+        log(startTime, 'kept ' +str(keep.sum())+ ' of ' +str(len(keep))+ ' ' +
+            str(n)+ '-grams with counts over ' +str(cutoffs[n-1]))
+    return keeps
+
+
+def select_rows(tables,keeps):
+    return [(ngramIds[keep],counts[keep])
+            for (ngramIds,counts),keep in zip(tables,keeps)]
+
+
+def apply_count_cutoffs(tables,cutoffs,vocabSize,startTime):
+    '''
+    Drop the n-grams of order n seen no more than cutoffs[n-1] times, plus
+    every n-gram whose history or suffix got dropped (see
+    get_cutoff_keeps()).
+    '''
+    return select_rows(tables,get_cutoff_keeps(tables,cutoffs,vocabSize,
+                                               startTime))
+
+
+def get_marginal_log_probs(tables,logProbs,vocabSize,startId=None):
+    '''
+    The (logged) probability of every n-gram as a whole, by the chain rule:
+    P(w1..wn) = P(w1..wn-1) p(wn|w1..wn-1). <s> (the word startId) has no
+    unigram probability, but every line starts with it, so like SRILM it
+    counts as certain when it is the first word.
+    '''
+    marginals = [np.where(tables[0][0][:,0] == startId,0.,logProbs[0])]
+    for n in range(2,len(tables)+1):
+        prefixRows = find_rows(tables[n-2][0],tables[n-1][0][:,:-1],vocabSize)
+        marginals.append(marginals[n-2][prefixRows] + logProbs[n-1])
+    return marginals
+
+
+def get_entropy_deltas(tables,logProbs,vocabSize,startId=None):
+    '''
+    For every n-gram hw of order 2 and up, the relative entropy between the
+    model with and without it (Stolcke 1998):
+
+        D(hw) = -P(h) [ p(w|h) (log p'(w|h) - log p(w|h))
+                        + num(h) (log alpha'(h) - log alpha(h)) ]
+
+    where num(h) is the mass h leaves for backing off, alpha(h) its
+    backoff weight, and p'(w|h) = alpha'(h) p(w|h') and alpha'(h) what they
+    become once hw is dropped. Returns one array per order, starting at
+    the bigrams.
+    '''
+    marginals = get_marginal_log_probs(tables,logProbs,vocabSize,startId)
+    deltas = []
+    for n in range(2,len(tables)+1):
+        ngramIds = tables[n-1][0]
+        if len(ngramIds) == 0:
+            deltas.append(np.zeros(0))
+            continue
+        lowerIds = tables[n-2][0]
+        probs = np.exp(logProbs[n-1])
+        lowerLogProbs = logProbs[n-2][find_rows(lowerIds,ngramIds[:,1:],
+                                                vocabSize)]
+        lowerProbs = np.exp(lowerLogProbs)
+        starts, groups = get_context_groups(ngramIds)
+        numerators = (1 - np.add.reduceat(probs,starts))[groups]
+        denominators = (1 - np.add.reduceat(lowerProbs,starts))[groups]
+        logAlphas = (np.log(np.maximum(numerators,MIN_MASS)) -
+                     np.log(np.maximum(denominators,MIN_MASS)))
+        newLogAlphas = (np.log(numerators + probs) -
+                        np.log(denominators + lowerProbs))
+        contextMarginals = marginals[n-2][find_rows(lowerIds,ngramIds[:,:-1],
+                                                    vocabSize)]
+        deltas.append(-np.exp(contextMarginals)*(
+            probs*(lowerLogProbs + newLogAlphas - logProbs[n-1]) +
+            np.maximum(numerators,0)*(newLogAlphas - logAlphas)))
+    return deltas
+
+
+def get_entropy_keeps(tables,deltas,threshold,vocabSize):
+    '''
+    Return the masks of the n-grams to keep, per order: all unigrams, the
+    n-grams with a delta of at least threshold, and from the top order down
+    the history and suffix of every n-gram kept.
+    '''
+    keeps = [np.ones(len(tables[0][1]),dtype=bool)]
+    keeps += [delta >= threshold for delta in deltas]
+    for n in range(len(tables),1,-1):
+        ngramIds = tables[n-1][0][keeps[n-1]]
+        lowerIds = tables[n-2][0]
+        for neededIds in (ngramIds[:,:-1],ngramIds[:,1:]):
+            keeps[n-2][find_rows(lowerIds,neededIds,vocabSize)] = True
+    return keeps
+
+
+def prune_by_entropy(tables,logProbs,vocabSize,startTime,threshold=None,
+                     targetSize=None,startId=None):
+    '''
+    Drop the n-grams (order 2 and up) whose relative entropy delta is under
+    threshold, or, given a targetSize, keep as many of the n-grams with the
+    largest deltas as fit in a model of targetSize n-grams in total (unigrams
+    included, and never pruned). n-grams which are the history or suffix of a
+    kept n-gram are always kept.
+    Returns the pruned tables, their (logged) probabilities and the
+    recomputed (logged) backoff weights.
+
+    The deltas and the recomputed weights assume a normalized backoff model,
+    whose every context leaves over the mass its backoff weight hands down:
+    Katz, Kneser-Ney or Witten-Bell, which are the only ones ngrams.py prunes.
+    '''
+    deltas = get_entropy_deltas(tables,logProbs,vocabSize,startId)
+    if targetSize is None:
+        keeps = get_entropy_keeps(tables,deltas,threshold,vocabSize)
+    else:
+        # the kept histories and suffixes come on top of the n-grams picked
+        # by their deltas, so search for the largest number of n-grams to
+        # pick which still gives a model within targetSize
+        sortedDeltas = np.sort(np.concatenate(deltas))[::-1]
+        low, high = 0, len(sortedDeltas)
+        keeps = get_entropy_keeps(tables,deltas,np.inf,vocabSize)
+        while low < high:
+            middle = (low+high+1)//2
+            middleKeeps = get_entropy_keeps(tables,deltas,
+                                            sortedDeltas[middle-1],vocabSize)
+            if sum(keep.sum() for keep in middleKeeps) <= targetSize:
+                low = middle
+                keeps = middleKeeps
+            else:
+                high = middle-1
+
+    prunedTables = []
+    prunedLogProbs = []
+    for n,((ngramIds,counts),logProb,keep) in enumerate(zip(tables,logProbs,
+                                                           keeps),1):
+        prunedTables.append((ngramIds[keep],counts[keep]))
+        prunedLogProbs.append(logProb[keep])
+        log(startTime, 'kept ' +str(keep.sum())+ ' of ' +str(len(keep))+ ' ' +
+            str(n)+ '-grams after entropy pruning')
+    return (prunedTables, prunedLogProbs,
+            get_katz_bow_arrays(prunedTables,prunedLogProbs,vocabSize))
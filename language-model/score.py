@@ -0,0 +1,213 @@
+'''
+USAGE:$ python3 score.py -lm MODEL -i TEXTFILE [--ids] [--verbose]
+
+DESCRIPTION: Score sentences with an n-gram model and report their log10
+probability, the perplexity and the OOV rate.
+
+MODEL is an ARPA file (may be gzipped) or a binary model from binary_lm.py.
+TEXTFILE has one sentence per line; <s> and </s> are added if missing, and
+with --ids the first token of every line (an utterance ID, as in
+stk-style/transcripts) is skipped.
+
+Lookups follow the usual ARPA backoff: the longest n-gram of the history plus
+the word which is in the model gives the probability, plus the backoff
+weights of all the longer histories which weren't. The n-grams sharing a
+history sit next to each other in the sorted tables, so for every history we
+find that stretch of rows once, for it and all its suffixes (its "context
+state"), and keep the most recent states in an LRU cache. Repeated histories,
+which is most of them, then cost one binary search per backoff step.
+'''
+
+from functools import lru_cache
+from binary_lm import load_binary_lm, get_word_id, MAGIC
+from arpa import read_arpa
+from corpus_stats import get_word_index
+from bisect import bisect_left, bisect_right
+from instrument import log
+import argparse
+import time
+
+CACHE_SIZE = 100000
+
+
+def load_lm(lmPath,cacheSize=CACHE_SIZE):
+    '''
+    Load an ARPA or binary model for scoring. Returns a dictionary with the
+    order, the per order 'ids', 'probs' and 'bows' arrays, a 'word_id'
+    function mapping a word to its ID (or None), and the cache of context
+    states.
+    '''
+    with open(lmPath,'rb') as lmFile:
+        isBinary = lmFile.read(len(MAGIC)) == MAGIC
+    if isBinary:
+        lm = load_binary_lm(lmPath)
+        lm['word_id'] = lru_cache(maxsize=cacheSize)(
+            lambda word: get_word_id(lm,word))
+    else:
+        vocab, ngramIds, logProbs, logBows = read_arpa(lmPath)
+        wordIndex = get_word_index(vocab)
+        lm = {'order': len(ngramIds), 'ids': ngramIds, 'probs': logProbs,
+              'bows': logBows[:-1], 'word_id': wordIndex.get}
+    lm['context_states'] = lru_cache(maxsize=cacheSize)(
+        lambda context: get_context_states(lm,context))
+    return lm
+
+
+def find_prefix_range(ngramIds,prefix,low=0,high=None):
+    '''
+    Return the stretch of rows [low, high) of a sorted table whose first
+    words are prefix, narrowing it down one column at a time.
+    '''
+    if high is None:
+        high = len(ngramIds)
+    for column,wordId in enumerate(prefix):
+        if low == high:
+            break
+        columnIds = ngramIds[:,column]
+        low, high = (bisect_left(columnIds,wordId,low,high),
+                     bisect_right(columnIds,wordId,low,high))
+    return low, high
+
+
+def get_context_states(lm,context):
+    '''
+    For a history (tuple of word IDs) and each of its suffixes, longest
+    first, return the rows of the next order up which continue it, and its
+    own backoff weight.
+    '''
+    states = []
+    for start in range(len(context)+1):
+        history = context[start:]
+        n = len(history)
+        rows = find_prefix_range(lm['ids'][n],history)
+        bow = 0.
+        if n > 0:
+            low, high = find_prefix_range(lm['ids'][n-1],history)
+            if low < high:
+                bow = float(lm['bows'][n-1][low])
+        states.append((n,rows,bow))
+    return tuple(states)
+
+
+def score_word(lm,context,wordId):
+    '''
+    Return the log10 probability of a word given a history (tuple of word
+    IDs, at most order-1 long).
+    '''
+    backedOff = 0.
+    for n,(low,high),bow in lm['context_states'](context):
+        if low < high:
+            row = bisect_left(lm['ids'][n][:,n],wordId,low,high)
+            if row < high and lm['ids'][n][row,n] == wordId:
+                return backedOff + float(lm['probs'][n][row])
+        backedOff += bow
+    return backedOff + float(lm['probs'][0][wordId])
+
+
+def score_sentence(lm,words):
+    '''
+    Score one sentence (a list of words without <s> and </s>). Returns the
+    total log10 probability, the number of words scored (</s> included) and
+    the number of out-of-vocabulary words. OOVs are mapped to <unk> if the
+    model has it; otherwise they are skipped and the history starts over.
+    '''
+    wordId = lm['word_id']
+    unkId = wordId('<unk>')
+    maxContext = lm['order']-1
+    context = (wordId('<s>'),) if wordId('<s>') is not None else ()
+    logProb = 0.
+    numScored = 0
+    numOOV = 0
+    for word in words + ['</s>']:
+        currentId = wordId(word)
+        if currentId is None:
+            numOOV += 1
+            if unkId is None:
+                context = ()
+                continue
+            currentId = unkId
+        history = context[max(len(context)-maxContext,0):]
+        logProb += score_word(lm,history,currentId)
+        numScored += 1
+        context = context + (currentId,)
+    return logProb, numScored, numOOV
+
+
+def score_sentences(lm,sentences):
+    '''
+    Score a batch of sentences (lists of words). Returns the list of
+    per-sentence (logProb, numScored, numOOV) and a dictionary of totals,
+    with the perplexity and the OOV rate.
+    '''
+    results = [score_sentence(lm,words) for words in sentences]
+    totalLogProb = sum(result[0] for result in results)
+    numScored = sum(result[1] for result in results)
+    numOOV = sum(result[2] for result in results)
+    numWords = sum(len(words) for words in sentences)
+    totals = {'sentences': len(results),
+              'words': numWords,
+              'oovs': numOOV,
+              'oov_rate': numOOV/numWords if numWords else 0.,
+              'logprob': totalLogProb,
+              'perplexity': 10**(-totalLogProb/numScored) if numScored
+              else float('inf')}
+    return results, totals
+
+
+def read_sentences(fileName,hasIds=False):
+    '''
+    Return the sentences of a text file as lists of words, without any <s>
+    and </s> already in it (and without the utterance IDs if hasIds).
+    '''
+    sentences = []
+    with open(fileName, encoding='utf-8') as inFile:
+        for line in inFile:
+            words = line.split()
+            if hasIds:
+                words = words[1:]
+            if words and words[0] == '<s>':
+                words = words[1:]
+            if words and words[-1] == '</s>':
+                words = words[:-1]
+            sentences.append(words)
+    return sentences
+
+
+def score_file(lm,fileName,hasIds=False):
+    return score_sentences(lm,read_sentences(fileName,hasIds))
+
+
+def parse_user_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-lm','--model', type=str, required=True,
+                        help='ARPA (.gz ok) or binary model')
+    parser.add_argument('-i','--infile', type=str, required=True,
+                        help='text to score, one sentence per line')
+    parser.add_argument('--ids', action='store_true',
+                        help='the first token of every line is an ID')
+    parser.add_argument('-v','--verbose', action='store_true',
+                        help='print the score of every sentence')
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_user_args()
+    startTime = time.time()
+    lm = load_lm(args.model)
+    log(startTime, 'loaded ' +str(lm['order'])+ '-gram model')
+    sentences = read_sentences(args.infile,args.ids)
+    results, totals = score_sentences(lm,sentences)
+    if args.verbose:
+        for words,(logProb,numScored,numOOV) in zip(sentences,results):
+            print(' '.join(words) +'\tlogprob= '+ str("%.4f" % logProb) +
+                  '\toovs= '+ str(numOOV))
+    log(startTime, str(totals['sentences'])+ ' sentences, ' +
+        str(totals['words'])+ ' words, ' +str(totals['oovs'])+ ' OOVs (' +
+        str("%.2f" % (100*totals['oov_rate']))+ '%)')
+    print('logprob= ' +str("%.4f" % totals['logprob'])+
+          ' ppl= ' +str("%.4f" % totals['perplexity']))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,282 @@
+from corpus_stats import find_rows, get_context_groups, get_unigram_counts
+from instrument import log
+import numpy as np
 
-def apply_smoothing(ngrams, ngramOrder, smoothing, startTime, log=True):
-    
-    if smoothing == "laplace":
-        numSmooth = .0001
-        denominator = (len(ngrams)+ len(ngrams)**ngramOrder)
-        probDict={}
-        for key, value in Counter(ngrams).items():
-            probDict[key] = (value + numSmooth) / denominator
-
-    elif smoothing == 'turing':
-        # N = total number of n-grams in text
-        # N_1 = number of hapaxes
-        # r = frequency of an n-gram
-        # n_r = number of n-grams which occured r times
-        # P_T = r*/N, the probability of an n-gram which occured r times
-        # r* = (r+1) * ( (n_{r+1}) / (n_r) ), the smoothed count for an ngram
-        N = len(ngrams)
-        freqDist_ngrams={}
-        for key,value in Counter(ngrams).items():
-            # key = n-gram, value = r
-            freqDist_ngrams[key] = value
-        freqDist_freqs={}
-        for key,value in Counter(freqDist_ngrams.values()).items():
-            # key = r, value = n_r
-            freqDist_freqs[key] = value
-        probDict={}
-        for key,value in freqDist_ngrams.items():
-            r = value
-            n_r = freqDist_freqs[r]
-            try:
-                n_r_plus_1 = freqDist_freqs[r+1]
-            except KeyError as exception:
-                print('There are no n-grams with frequency ' +str(exception)+
-                      '... using ' +str(r)+ ' instead')
-                n_r_plus_1 = n_r
-            r_star = (r+1)*((n_r_plus_1)/(n_r))
-            probDict[key] = r_star/N
-        
-    print('[  '+ str("%.2f" % (time.time()-startTime)) +'  \t] '+
-          str(ngramOrder) + '-gram probability dictionary made')
-    
-    return probDict
+
+##
+## Count-of-counts smoothing on whole orders
+##
+## Each function below smooths one order of the integer count tables from
+## corpus_stats.get_count_tables() at once and returns the (logged)
+## conditional probability of every n-gram in the table. Laplace and
+## Good-Turing give discounted probabilities, which leave mass over for
+## backing off (see backoff.get_katz_bow_arrays()); Witten-Bell interpolates
+## with the order below it, and comes with its own backoff weights (see
+## get_witten_bell_arrays()).
+##
+
+def get_counts_of_counts(counts):
+    '''
+    Return n_r for every r as one histogram: countsOfCounts[r] is the number
+    of n-grams which occurred r times.
+    '''
+    return np.bincount(counts)
+
+
+def get_context_counts(tables,n,vocabSize):
+    '''
+    Return the count of the history (first n-1 words) of every n-gram of
+    order n, or the total number of tokens for the unigrams.
+    '''
+    if n == 1:
+        return tables[0][1].sum()
+    contextIds, contextCounts = tables[n-2]
+    return contextCounts[find_rows(contextIds,tables[n-1][0][:,:-1],vocabSize)]
+
+
+def get_laplace_array(tables,n,vocabSize,delta=1.):
+    '''
+    Additive smoothing: P(w|h) = (c(hw) + delta) / (c(h) + delta*|V|)
+    '''
+    counts = tables[n-1][1]
+    contextCounts = get_context_counts(tables,n,vocabSize)
+    return np.log((counts + delta)/(contextCounts + delta*vocabSize))
+
+
+def get_good_turing_counts(counts):
+    '''
+    Simple Good-Turing (Gale & Sampson 1995). Returns the smoothed count r* of
+    every n-gram, scaled so that all of them together leave a share of n_1/N
+    of the total count N for unseen n-grams. A count is never smoothed
+    upwards (r* <= r), so every context keeps some mass to back off with.
+
+    The n_r are averaged over the gaps between non-empty buckets (Z_r) and a
+    line log(Z_r) = a + b*log(r) is fit through them. Small r use the plain
+    Turing estimate r* = (r+1) n_{r+1}/n_r for as long as it differs
+    significantly from the one of the fitted line, after which the fitted
+    line is used for every larger r.
+    '''
+    countsOfCounts = get_counts_of_counts(counts)
+    r = np.flatnonzero(countsOfCounts)
+    r = r[r > 0]
+    n_r = countsOfCounts[r].astype(float)
+    N = (r*n_r).sum()
+    if len(r) < 2:
+        # nothing to fit a line through, so don't discount anything
+        return counts.astype(float)
+
+    # Z_r = n_r averaged over the distance to the neighbouring buckets
+    q = np.append(0,r[:-1])
+    t = np.append(r[1:],2*r[-1]-q[-1])
+    Z = n_r/(.5*(t-q))
+    b, a = np.polyfit(np.log(r),np.log(Z),1)
+    lgtEstimates = r*(1+1/r)**(b+1)
+
+    # plain Turing estimates, where n_{r+1} exists
+    n_rPlus1 = np.append(countsOfCounts,0)[r+1].astype(float)
+    turingEstimates = (r+1)*n_rPlus1/n_r
+    spread = 1.96*np.sqrt((r+1)**2*(n_rPlus1/n_r**2)*(1+n_rPlus1/n_r))
+    useTuring = np.logical_and.accumulate(
+        (n_rPlus1 > 0) & (np.abs(turingEstimates-lgtEstimates) > spread))
+    rStars = np.where(useTuring,turingEstimates,lgtEstimates)
+
+    # renormalize so the seen n-grams share 1 - n_1/N of the probability
+    N_prime = (n_r*rStars).sum()
+    rStars *= (1 - countsOfCounts[1]/N)*N/N_prime
+    rStars = np.minimum(rStars,r)
+    smoothed = np.zeros(len(countsOfCounts))
+    smoothed[r] = rStars
+    return smoothed[counts]
+
+
+def get_good_turing_array(tables,n,vocabSize):
+    '''
+    P(w|h) = r*(hw) / c(h), with r* from get_good_turing_counts()
+    '''
+    smoothedCounts = get_good_turing_counts(tables[n-1][1])
+    return np.log(smoothedCounts/get_context_counts(tables,n,vocabSize))
+
+
+def get_witten_bell_array(tables,n,vocabSize,lowerLogProbs=None,
+                          startId=None):
+    '''
+    Interpolated Witten-Bell (Witten & Bell 1991):
+
+        P(w|h) = (c(hw) + T(h) P(w|h')) / (c(h) + T(h))
+
+    where T(h) is the number of distinct words seen after h, and P(w|h') is
+    the (interpolated) probability from the order below, given as
+    lowerLogProbs, or for the unigrams the uniform distribution over the
+    words other than <s> (the word startId), which gets a probability of 0.
+    '''
+    ngramIds, counts = tables[n-1]
+    if len(counts) == 0:
+        return np.zeros(0)
+    if n == 1:
+        counts = get_unigram_counts(tables,startId)
+        isPredicted = ngramIds[:,0] != startId
+        lowerProbs = isPredicted/(vocabSize - (~isPredicted).sum())
+    starts, groups = get_context_groups(ngramIds)
+    totals = np.add.reduceat(counts,starts)
+    types = np.add.reduceat((counts > 0).astype(np.int64),starts)
+    if n > 1:
+        lowerRows = find_rows(tables[n-2][0],ngramIds[:,1:],vocabSize)
+        lowerProbs = np.exp(lowerLogProbs[lowerRows])
+    with np.errstate(divide='ignore'):
+        return np.log((counts + types[groups]*lowerProbs)/
+                      (totals + types)[groups])
+
+
+def get_smoothed_arrays(tables,vocabSize,smoothing,startTime):
+    '''
+    Smooth every order of the count tables with 'laplace' or 'turing', and
+    return the list of (logged) probability arrays.
+    '''
+    logProbs = []
+    for n in range(1,len(tables)+1):
+        if smoothing == 'laplace':
+            logProbs.append(get_laplace_array(tables,n,vocabSize))
+        elif smoothing == 'turing':
+            logProbs.append(get_good_turing_array(tables,n,vocabSize))
+        log(startTime, str(n) + '-gram probability array made')
+    return logProbs
+
+
+def get_witten_bell_arrays(tables,vocabSize,startTime,startId=None):
+    '''
+    Interpolated Witten-Bell for every order. Like
+    get_modified_kneser_ney_arrays(), returns the (logged) probability of
+    every n-gram and, for all but the highest order, the (logged) backoff
+    weight of every n-gram: the interpolation weight T(h)/(c(h)+T(h)) it
+    gives the order below when used as a context h, so that a word never
+    seen after h gets T(h)/(c(h)+T(h)) P(w|h'). n-grams never used as a
+    context get a weight of 1.
+    '''
+    logProbs = []
+    logBows = [np.zeros(len(counts)) for ngramIds,counts in tables[:-1]]
+    for n in range(1,len(tables)+1):
+        lowerLogProbs = logProbs[-1] if logProbs else None
+        logProbs.append(get_witten_bell_array(tables,n,vocabSize,
+                                              lowerLogProbs,startId))
+        ngramIds, counts = tables[n-1]
+        if n > 1 and len(counts):
+            starts, groups = get_context_groups(ngramIds)
+            totals = np.add.reduceat(counts,starts)
+            types = np.diff(np.append(starts,len(counts)))
+            contextRows = find_rows(tables[n-2][0],ngramIds[starts,:-1],
+                                    vocabSize)
+            logBows[n-2][contextRows] = np.log(types/(totals+types))
+        log(startTime, str(n) + '-gram Witten-Bell probabilities made')
+    return logProbs, logBows
+
+
+##
+## Interpolated modified Kneser-Ney (Chen & Goodman 1998)
+##
+## Works on the integer count tables from corpus_stats.get_count_tables(). All
+## steps are whole-array operations: since every table is sorted
+## lexicographically, the n-grams sharing a context sit next to each other,
+## so per-context sums are a single np.add.reduceat() over the table.
+##
+
+# used for an order whose counts-of-counts can't give a discount
+# (e.g. no n-grams seen exactly twice, which happens on toy corpora)
+DEFAULT_KN_DISCOUNTS = (.5, 1., 1.5)
+
+
+def get_kn_adjusted_counts(tables,vocabSize):
+    '''
+    The highest order keeps its raw counts. Every lower order n-gram gets its
+    continuation count instead: the number of distinct words seen before it,
+    read off the suffixes of the next order up. Higher order n-grams only
+    ever seen at the start of a line (i.e. after nothing, like <s> w) keep
+    their raw counts, while such unigrams (<s> itself) get a count of 0, as
+    they are never predicted.
+    '''
+    adjustedCounts = []
+    for n in range(1,len(tables)):
+        ngramIds, counts = tables[n-1]
+        higherIds = tables[n][0]
+        suffixRows = find_rows(ngramIds,higherIds[:,1:],vocabSize)
+        leftExtensions = np.bincount(suffixRows,minlength=len(counts))
+        if n == 1:
+            adjustedCounts.append(leftExtensions)
+        else:
+            adjustedCounts.append(np.where(leftExtensions > 0,leftExtensions,
+                                           counts))
+    adjustedCounts.append(tables[-1][1])
+    return adjustedCounts
+
+
+def get_kn_discounts(adjustedCounts):
+    '''
+    Return the discounts (D1, D2, D3+) for one order from the counts-of-counts
+    n1..n4 of its adjusted counts.
+    '''
+    n1, n2, n3, n4 = np.bincount(adjustedCounts,minlength=5)[1:5]
+    discounts = []
+    for k, default in enumerate(DEFAULT_KN_DISCOUNTS,1):
+        nk, nkPlus1 = (n1, n2, n3, n4)[k-1:k+1]
+        if n1 and n2 and nk:
+            Y = n1/(n1+2*n2)
+            discount = k - (k+1)*Y*nkPlus1/nk
+            if 0 < discount <= k:
+                discounts.append(discount)
+                continue
+        discounts.append(default)
+    return np.array(discounts)
+
+
+def get_modified_kneser_ney_arrays(tables,vocabSize,startTime,keeps=None):
+    '''
+    Interpolated modified Kneser-Ney for any order. Returns two lists of
+    arrays parallel to the tables: the (logged) interpolated probability of
+    every n-gram, and (for all but the highest order) the (logged) backoff
+    weight of every n-gram, i.e. the mass it passes on to the lower order
+    when used as a context. n-grams never used as a context get a weight of 1.
+
+    keeps are the masks of the n-grams left by count cutoffs (see
+    prune.get_cutoff_keeps()). The tables are then the ones from before the
+    cutoffs, so that the continuation counts and discounts are those of the
+    whole corpus, and the mass of the n-grams cut off goes to the order
+    below. Only the arrays of the kept n-grams are returned.
+    '''
+    if keeps is None:
+        keeps = [np.ones(len(counts),dtype=bool) for ngramIds,counts in tables]
+    adjustedCounts = get_kn_adjusted_counts(tables,vocabSize)
+    probs = []
+    logBows = [np.zeros(len(counts)) for ngramIds,counts in tables[:-1]]
+    for n in range(1,len(tables)+1):
+        ngramIds = tables[n-1][0]
+        counts = adjustedCounts[n-1]
+        if len(counts) == 0:
+            probs.append(np.zeros(0))
+            continue
+        D = get_kn_discounts(counts)
+        # discount of each n-gram by its count: none, D1, D2 or D3+
+        discounts = np.append(0,D)[np.minimum(counts,3)]
+        starts, groups = get_context_groups(ngramIds)
+        totals = np.add.reduceat(counts,starts)
+        # how many n-grams of each context got discounted by D1, D2 and D3+
+        numDiscounted = [np.add.reduceat((np.minimum(counts,3) == k)
+                                         .astype(np.int64),starts)
+                         for k in (1,2,3)]
+        # plus what is left of the n-grams which were cut off
+        cutMass = np.add.reduceat(np.where(keeps[n-1],0,counts-discounts),
+                                  starts)
+        gammas = (sum(D[k]*numDiscounted[k] for k in range(3)) +
+                  cutMass)/totals
+        if n == 1:
+            # the unigrams interpolate with the uniform distribution
+            lowerProbs = 1/vocabSize
+        else:
+            lowerRows = find_rows(tables[n-2][0],ngramIds[:,1:],vocabSize)
+            lowerProbs = probs[n-2][lowerRows]
+            contextRows = find_rows(tables[n-2][0],ngramIds[starts,:-1],
+                                    vocabSize)
+            logBows[n-2][contextRows] = np.log(gammas)
+        probs.append((counts-discounts)/totals[groups] +
+                     gammas[groups]*lowerProbs)
+        log(startTime, str(n) + '-gram Kneser-Ney probabilities made')
+    return ([np.log(prob[keep]) for prob,keep in zip(probs,keeps)],
+            [logBow[keep] for logBow,keep in zip(logBows,keeps)])
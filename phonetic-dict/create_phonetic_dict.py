@@ -1,66 +1,278 @@
 from lookup_tables import kyrgyz_table, kazakh_table
+from multiprocessing import Pool
+from functools import partial
+from collections import Counter
 import argparse
-import re
+import math
 
-def save_pronunciation_dict(tokens,lookupTable,lang):
+# tokens handed to a worker at a time when converting with several jobs
+CHUNK_SIZE = 10000
+
+BACK_VOWELS = 'аоуы'
+FRONT_VOWELS = 'иеэөү'
+
+# symbols of the lexicon FST, as in Kaldi's lang directories
+EPSILON = '<eps>'
+SILENCE_PHONE = 'SIL'
+SENTENCE_MARKERS = ['<s>','</s>']
+BACKOFF_SYMBOL = '#0'
+# ngrams.py leaves out lines of this many tokens or fewer (<s> and </s>
+# included), so the lexicon FST does too, to cover the words of the grammar
+LEN_SENTENCE_CUTOFF = 4
+
+# kyrgyz plosives which depend on the neighbouring vowels:
+# (phone next to back vowels, phone next to front vowels)
+kyrgyz_context_letters = {'к':('kh','k'),
+                          'г':('gh','g')}
+
+def get_vowel_class(character):
+    if character in BACK_VOWELS:
+        return 'back'
+    elif character in FRONT_VOWELS:
+        return 'front'
+    return 'other'
+
+
+def compile_g2p(lookupTable,lang):
+    '''
+    Compile the letter table and the context-dependent rules of a language
+    into one table keyed by (letter, left vowel class, right vowel class),
+    so that a word is converted in a single left-to-right pass (see
+    get_phonemes()). The rules say that a plosive takes the quality of the
+    vowel following it or, failing that, of the vowel preceding it; any other
+    letter is looked up in lookupTable.
+    '''
+    contextLetters = kyrgyz_context_letters if lang == 'kyrgyz' else {}
+    classes = ['back','front','other']
+    contextual = {}
+    for letter,(backPhone,frontPhone) in contextLetters.items():
+        phones = {'back':backPhone+' ', 'front':frontPhone+' ',
+                  'other':lookupTable.get(letter,letter)}
+        for left in classes:
+            for right in classes:
+                vowel = right if right != 'other' else left
+                contextual[(letter,left,right)] = phones[vowel]
+    return {'letters':dict(lookupTable), 'contextual':contextual,
+            'contextLetters':set(contextLetters)}
+
+
+def get_phonemes(token,g2p):
+    '''
+    Given a word and a compiled g2p table (see compile_g2p()), return its
+    phones as a string with whitespace in between.
+    '''
+    letters = g2p['letters']
+    contextual = g2p['contextual']
+    contextLetters = g2p['contextLetters']
+    phones = []
+    for i,character in enumerate(token):
+        if character in contextLetters:
+            left = get_vowel_class(token[i-1]) if i > 0 else 'other'
+            right = get_vowel_class(token[i+1]) if i+1 < len(token) else 'other'
+            phones.append(contextual[(character,left,right)])
+        else:
+            phones.append(letters.get(character,character))
+    # in case we added a space to the end of the sequence
+    return ''.join(phones).strip()
+
+
+def get_phonemes_for_chunk(tokens,g2p):
+    return [get_phonemes(token,g2p) for token in tokens]
+
+
+def get_pronunciations(tokens,lookupTable,lang,jobs=1):
+    '''
+    Given a collection of words, return a list of (word, phonemes) pairs for
+    the sorted, unique words, converting chunks of them in jobs processes.
+    '''
+    tokens = sorted(set(tokens))
+    g2p = compile_g2p(lookupTable,lang)
+    if jobs > 1 and len(tokens) > CHUNK_SIZE:
+        chunks = [tokens[i:i+CHUNK_SIZE]
+                  for i in range(0,len(tokens),CHUNK_SIZE)]
+        with Pool(jobs) as pool:
+            phonemes = [phones for chunk in
+                        pool.imap(partial(get_phonemes_for_chunk,g2p=g2p),
+                                  chunks)
+                        for phones in chunk]
+    else:
+        phonemes = get_phonemes_for_chunk(tokens,g2p)
+    return list(zip(tokens,phonemes))
+
+
+def save_pronunciation_dict(tokens,lookupTable,lang,jobs=1,fst=False,
+                            silProb=0.5):
+    pronunciations = get_pronunciations(tokens,lookupTable,lang,jobs)
     outFile = open((lang+'.dict'), mode='wt', encoding='utf-8')
-    for token in sorted(set(tokens)):
-        # pass the token along, substituting letters for phones, and end up with
-        # a character string of phones with whitespace in between
-        phonemes = token
-        if lang == 'kyrgyz':
-            # syllable onset plosives followed by front/back vowels
-            phonemes = re.sub(r'к([аоуы])', r'kh \1', phonemes)
-            phonemes = re.sub(r'к([иеэөү])', r'k \1', phonemes)
-            phonemes = re.sub(r'г([аоуы])', r'gh \1', phonemes)
-            phonemes = re.sub(r'г([иеэөү])', r'g \1', phonemes)
-            # syllable final plosives preceded by front/back vowels
-            phonemes = re.sub(r'([аоуы])к([^аоуыиеэөү])', r'\1kh \2', phonemes)
-            phonemes = re.sub(r'([иеэөү])к([^аоуыиеэөү])', r'\1k \2', phonemes)
-            phonemes = re.sub(r'([аоуы])г([^аоуыиеэөү])', r'\1gh \2', phonemes)
-            phonemes = re.sub(r'([иеэөү])г([^аоуыиеэөү])', r'\1g \2', phonemes)
-            # word final plosives preceded by front/back vowels
-            phonemes = re.sub(r'([аоуы])к($)', r'\1kh', phonemes)
-            phonemes = re.sub(r'([иеэөү])к($)', r'\1k', phonemes)
-            phonemes = re.sub(r'([аоуы])г($)', r'\1gh', phonemes)
-            phonemes = re.sub(r'([иеэөү])г($)', r'\1g', phonemes)
-        elif lang == 'kazakh':
-            # no context-dependent rules for kazakh
-            pass
-        # replace all letters left over after context-dependent rules applied
-        for character in phonemes:
-            if character in lookupTable:
-                phonemes = re.sub(character, lookupTable[character], phonemes)
-        # in case we added a space to the end of the sequence
-        phonemes = phonemes.strip()
+    for token,phonemes in pronunciations:
         # print new line with the original cyrillic word and its phonemes
         print((token +' '+ phonemes), end='\n', file=outFile)
     outFile.close()
+    if fst:
+        save_lexicon_fst(pronunciations,lang,silProb)
+
+def add_disambig_symbols(pronunciations):
+    '''
+    Given (word, phonemes) pairs, return (word, phones) pairs where phones is
+    a list which ends in a disambiguation symbol #1, #2... if the
+    pronunciation is shared with another word or is the start of a longer
+    one (as Kaldi's add_lex_disambig.pl does), so that the lexicon FST can
+    be determinized. Also returns the highest symbol used.
+    '''
+    counts = Counter(phonemes for word,phonemes in pronunciations)
+    prefixes = set()
+    for phonemes in counts:
+        phones = phonemes.split()
+        for i in range(1,len(phones)):
+            prefixes.add(' '.join(phones[:i]))
+    lastUsed = Counter()
+    disambiguated = []
+    for word,phonemes in pronunciations:
+        phones = phonemes.split()
+        if not phones or counts[phonemes] > 1 or phonemes in prefixes:
+            lastUsed[phonemes] += 1
+            phones.append('#' +str(lastUsed[phonemes]))
+        disambiguated.append((word,phones))
+    return disambiguated, max(lastUsed.values(), default=0)
+
+
+def get_lexicon_fst_lines(pronunciations,silProb):
+    '''
+    Yield the lines of the lexicon FST (L) in OpenFst text format, as Kaldi's
+    make_lexicon_fst.pl makes them: every word is a path of phones from the
+    loop state back to it, with the word on its first arc. With a silProb
+    over 0, an optional SILENCE_PHONE may come at the start and after every
+    word. The loop state also has a #0:#0 self-loop for the backoff arcs of
+    the grammar.
+    '''
+    if silProb > 0:
+        silCost = '\t%f' % -math.log(silProb)
+        noSilCost = '\t%f' % -math.log(1-silProb)
+        start, loop, silence, nextState = 0, 1, 2, 3
+        yield '%d\t%d\t%s\t%s%s\n' % (start,loop,EPSILON,EPSILON,noSilCost)
+        yield '%d\t%d\t%s\t%s%s\n' % (start,loop,SILENCE_PHONE,EPSILON,
+                                      silCost)
+        yield '%d\t%d\t%s\t%s\n' % (silence,loop,SILENCE_PHONE,EPSILON)
+    else:
+        start = loop = 0
+        nextState = 1
+    for word,phones in pronunciations:
+        source = loop
+        output = word
+        for phone in phones[:-1]:
+            yield '%d\t%d\t%s\t%s\n' % (source,nextState,phone,output)
+            source = nextState
+            nextState += 1
+            output = EPSILON
+        lastPhone = phones[-1] if phones else EPSILON
+        if silProb > 0:
+            yield '%d\t%d\t%s\t%s%s\n' % (source,loop,lastPhone,output,
+                                          noSilCost)
+            yield '%d\t%d\t%s\t%s%s\n' % (source,silence,lastPhone,output,
+                                          silCost)
+        else:
+            yield '%d\t%d\t%s\t%s\n' % (source,loop,lastPhone,output)
+    yield '%d\t%d\t%s\t%s\n' % (loop,loop,BACKOFF_SYMBOL,BACKOFF_SYMBOL)
+    yield '%d\n' % loop
+
+
+def write_symbol_table(path,symbols):
+    with open(path, mode='wt', encoding='utf-8') as outFile:
+        outFile.writelines('%s %d\n' % (symbol,i)
+                           for i,symbol in enumerate(symbols))
+
+
+def save_lexicon_fst(pronunciations,lang,silProb=0.5):
+    '''
+    Write the lexicon FST of (word, phonemes) pairs to LANG.L.fst.txt, with
+    its symbol tables LANG.phones.txt and LANG.words.txt. The words table is
+    laid out like the one language-model/fst.py writes for the grammar, so
+    both agree for the same words: build the dictionary with -w G.words.txt,
+    or with --fst from the corpus ngrams.py was given. Compile with
+        fstcompile --isymbols=LANG.phones.txt --osymbols=LANG.words.txt
+                   LANG.L.fst.txt LANG.L.fst
+    '''
+    pronunciations, maxDisambig = add_disambig_symbols(pronunciations)
+    with open((lang+'.L.fst.txt'), mode='wt', encoding='utf-8') as outFile:
+        outFile.writelines(get_lexicon_fst_lines(pronunciations,silProb))
+    phones = sorted(set(phone for word,wordPhones in pronunciations
+                        for phone in wordPhones if not phone.startswith('#'))
+                    - {SILENCE_PHONE})
+    write_symbol_table(lang+'.phones.txt',
+                       [EPSILON,SILENCE_PHONE] + phones +
+                       ['#' +str(i) for i in range(maxDisambig+1)])
+    words = sorted(set(word for word,wordPhones in pronunciations)
+                   - set(SENTENCE_MARKERS))
+    write_symbol_table(lang+'.words.txt',
+                       [EPSILON] + words + [BACKOFF_SYMBOL] + SENTENCE_MARKERS)
+
+
+def read_corpus_tokens(fileName,lenSentenceCutoff=0):
+    '''
+    Return the set of words of a cleaned corpus, from the lines with more
+    than lenSentenceCutoff tokens (<s> and </s> included).
+    '''
+    tokens = set()
+    with open(fileName) as inFile:
+        for line in inFile:
+            if len(line.rstrip('\n').split(' ')) > lenSentenceCutoff:
+                tokens.update(line[4:-6].split())
+    return tokens
+
+
+def read_symbol_table_words(fileName):
+    '''
+    Return the words of a symbol table such as the G.words.txt of ngrams.py,
+    without <eps>, #0 and the sentence markers.
+    '''
+    special = set([EPSILON,BACKOFF_SYMBOL] + SENTENCE_MARKERS)
+    with open(fileName, encoding='utf-8') as inFile:
+        return set(line.split()[0] for line in inFile
+                   if line.strip() and line.split()[0] not in special)
+
 
 def parse_user_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('-i','--infile', type=str, help='the input text file')
+    parser.add_argument('-w','--words', type=str, default=None,
+                        help='take the words from this symbol table (e.g. the '
+                        'G.words.txt of ngrams.py) instead of the input file')
     parser.add_argument('-l','--language', type=str, default='kyrgyz',
                         choices=['kyrgyz','kazakh'], help='language of corpus')
+    parser.add_argument('-j','--jobs', type=int, default=1,
+                        help='number of processes converting words')
+    parser.add_argument('--fst', action='store_true',
+                        help='also write the lexicon as an OpenFst text FST '
+                        '(LANG.L.fst.txt) with its symbol tables')
+    parser.add_argument('--sil-prob', type=float, default=0.5,
+                        help='probability of optional silence between words '
+                        'in the lexicon FST (0 for none)')
     args = parser.parse_args()
+    if args.infile is None and args.words is None:
+        parser.error('give an input file (-i) or a symbol table (-w)')
+    if not 0 <= args.sil_prob < 1:
+        parser.error('--sil-prob must be at least 0 and below 1')
     return args
         
 if __name__ == '__main__':
     args = parse_user_args()
-    fileName = args.infile
     lang = args.language
-    # This script assumes that your corpus is already cleaned 
-    # (i.e. all words should be lowercase without any punctuation or numbers)
-    f = open(fileName)
-
-    tokens=set()
-    for line in f:
-        for token in line[4:-6].split():
-            tokens.add(token)
+    if args.words:
+        # exactly the words of the grammar, so that L and G share words.txt
+        tokens = read_symbol_table_words(args.words)
+    else:
+        # This script assumes that your corpus is already cleaned
+        # (i.e. all words should be lowercase without any punctuation or
+        # numbers)
+        # with --fst, only the lines ngrams.py counts, so that L and G
+        # share their words; a plain dictionary takes every line
+        tokens = read_corpus_tokens(args.infile,
+                                    LEN_SENTENCE_CUTOFF if args.fst else 0)
 
     if lang == 'kyrgyz':
         lookupTable=kyrgyz_table
     elif lang == 'kazakh':
         lookupTable=kazakh_table
 
-    save_pronunciation_dict(tokens,lookupTable,lang)
+    save_pronunciation_dict(tokens,lookupTable,lang,args.jobs,args.fst,
+                            args.sil_prob)